@@ -3,268 +3,108 @@ import streamlit as st
 # SKAL være allerførst
 st.set_page_config(page_title="AI-assisteret SEO generator", layout="wide")
 
-import os
 import openai
-import pandas as pd
-import PyPDF2
-import io
-import json
-import requests
-import re
-from bs4 import BeautifulSoup
-
-# Vælg korrekt state-fil
-if os.path.exists("/mnt/data") and os.access("/mnt/data", os.W_OK):
-    STATE_FILE = "/mnt/data/state.json"
-else:
-    STATE_FILE = "state.json"
-
-def load_state():
-    if os.path.exists(STATE_FILE):
-        try:
-            with open(STATE_FILE, "r") as f:
-                s = json.load(f)
-            for k, v in s.items():
-                st.session_state[k] = v
-        except:
-            initialize_state()
-    else:
-        initialize_state()
-
-def save_state():
-    folder = os.path.dirname(STATE_FILE)
-    if folder and not os.path.exists(folder):
-        try:
-            os.makedirs(folder, exist_ok=True)
-        except:
-            st.error("Fejl ved oprettelse af mappe til state.")
-    to_save = {
-        "profiles": st.session_state.get("profiles", {}),
-        "api_key": st.session_state.get("api_key", ""),
-        "page": st.session_state.get("page", "seo"),
-        "generated_texts": st.session_state.get("generated_texts", []),
-        "current_profile": st.session_state.get("current_profile", "Standard profil"),
-        "delete_profile": st.session_state.get("delete_profile", None)
-    }
-    try:
-        with open(STATE_FILE, "w") as f:
-            json.dump(to_save, f)
-    except:
-        st.error("Fejl ved gemning af state.")
-
-def initialize_state():
-    st.session_state["profiles"] = {}
-    st.session_state["api_key"] = ""
-    st.session_state["page"] = "seo"
-    st.session_state["generated_texts"] = []
-    st.session_state["current_profile"] = "Standard profil"
-    st.session_state["delete_profile"] = None
-    save_state()
 
-load_state()
+from app_common import show_run_summary, start_gateway_session
+from context_index import (
+    BRAND_CONTEXT_TOKENS, BRAND_QUERY, BRAND_SOURCE_TOKENS, PRODUCT_CONTEXT_TOKENS, select_context
+)
+from crawler import Crawler, page_text, product_text
+from file_ingest import cached, compact_table, digest, extract_pdf, read_table, suggest_columns
+import llm_gateway
+from llm_metrics import traced_run
+from product_enrichment import EnrichmentCache, build_product_info, enrich_products
+from rate_limit import estimate_tokens
+from seo_pipeline import ARTICLE_WORKERS, build_base_prompt, build_extra_instructions, generate_articles
+from state_store import DEFAULT_PROFILE, StateStore
+
+TEXTS_PER_PAGE = 10
+
+@st.cache_resource
+def get_store():
+    """Én database pr. proces; en gammel state.json importeres første gang."""
+    store = StateStore()
+    store.migrate_json()
+    return store
+
+store = get_store()
+
+def remember(key, value):
+    """Sætter en værdi for sessionen og gemmer den som startværdi for nye sessioner."""
+    st.session_state[key] = value
+    store.set_setting(key, value)
+
+if "page" not in st.session_state:
+    st.session_state["page"] = store.get_setting("page", "seo")
+    st.session_state["current_profile"] = store.get_setting("current_profile", DEFAULT_PROFILE)
+    st.session_state["delete_profile"] = None
 
-if not st.session_state.get("api_key"):
+api_key = store.get_setting("api_key", "")
+if not api_key:
     key_in = st.text_input("Indtast OpenAI API-nøgle", type="password")
     if key_in:
-        st.session_state["api_key"] = key_in
-        save_state()
+        api_key = key_in
+        store.set_setting("api_key", key_in)
     else:
         st.stop()
 
-openai.api_key = st.session_state["api_key"]
+openai.api_key = api_key
 
-def fetch_website_content(url):
-    """Henter sideindhold som ren tekst, fjerner script/style."""
-    try:
-        r = requests.get(url, timeout=10)
-        r.raise_for_status()
-        soup = BeautifulSoup(r.text, "html.parser")
-        for s in soup(["script", "style"]):
-            s.decompose()
-        return soup.get_text(separator=' ', strip=True)
-    except Exception as e:
-        st.error(f"Fejl ved {url}: {e}")
-        return ""
+start_gateway_session()
 
-def fetch_product_links(url):
-    links = []
-    try:
-        resp = requests.get(url, timeout=10)
-        resp.raise_for_status()
-        soup = BeautifulSoup(resp.text, "html.parser")
-        for a_tag in soup.find_all("a", href=True):
-            href = a_tag["href"]
-            if href.startswith("/products/"):
-                full = "https://noyer.dk" + href
-                if full not in links:
-                    links.append(full)
-    except Exception as e:
-        st.error(f"Fejl ved produktlinks: {e}")
-    return links
+@st.cache_resource
+def get_crawler():
+    """Én crawler pr. proces: delt forbindelsespulje og HTTP-cache."""
+    return Crawler()
 
-def fetch_product_text_raw(url):
-    try:
-        rr = requests.get(url, timeout=10)
-        rr.raise_for_status()
-        soup = BeautifulSoup(rr.text, "html.parser")
-        desc = soup.select_one(".product-info__description")
-        if desc:
-            return desc.get_text(separator=' ', strip=True)
+def fetch_pages(urls, parse, label):
+    """Henter sider samtidigt med fremdrift. Returnerer {url: tekst} for de sider der lykkedes."""
+    results = {}
+    if not urls:
+        return results
+    bar = st.progress(0.0, text=label)
+    for n, (url, text, err) in enumerate(get_crawler().fetch_many(urls, parse), start=1):
+        if err is not None:
+            st.error(f"Fejl ved {url}: {err}")
         else:
-            return soup.get_text(separator=' ', strip=True)
-    except Exception as e:
-        st.error(f"Fejl ved henting produktside: {e}")
-        return ""
-
-def automatically_enrich_product_text(raw_text):
-    if not raw_text.strip():
-        return ""
-    prompt = (
-        "Du får her en rå produkttekst. Strukturer og berig den let (tilføj evt. manglende data). "
-        "Undgå store markdown-overskrifter (###) og 'Produktbeskrivelse for'. "
-        "Undgå at ændre for meget i ordlyden.\n\n" +
-        raw_text[:15000]
-    )
+            results[url] = text
+        bar.progress(n / len(urls), text=f"{label} ({n}/{len(urls)})")
+    bar.empty()
+    return results
+
+def fetch_product_links(url):
     try:
-        r2 = openai.ChatCompletion.create(
-            model="gpt-4-turbo",
-            messages=[{"role": "user", "content": prompt}],
-            max_tokens=3000
-        )
-        enriched = r2.choices[0].message.content.strip()
-        enriched = enriched.replace("Produktbeskrivelse for ", "")
-        enriched = re.sub(r'^###\s+(.*)$', r'\1', enriched, flags=re.MULTILINE)
-        return enriched
+        return get_crawler().product_links(url)
     except Exception as e:
-        st.error(f"Fejl ved berigelse: {e}")
-        return raw_text
-
-def count_words(txt):
-    return len(txt.split())
-
-def generate_iterative_seo_text(base_prompt, min_len=700, max_tries=3):
-    final_text = ""
-    resp = openai.ChatCompletion.create(
-        model="gpt-4-turbo",
-        messages=[{"role": "user", "content": base_prompt}],
-        max_tokens=min_len * 3
-    )
-    text_draft = resp.choices[0].message.content.strip()
-    wcount = count_words(text_draft)
-
-    if wcount >= min_len:
-        final_text = text_draft
-    else:
-        final_text = text_draft
-        tries_left = max_tries - 1
-        for i in range(tries_left):
-            ext_prompt = (
-                f"Din tekst er {wcount} ord, men vi ønsker mindst {min_len}. "
-                "Uddyb og tilføj ekstra afsnit, eksempler, og detaljer, så teksten bliver sammenhængende og fyldig:\n\n" +
-                final_text
-            )
-            r2 = openai.ChatCompletion.create(
-                model="gpt-4-turbo",
-                messages=[{"role": "user", "content": ext_prompt}],
-                max_tokens=min_len * 3
-            )
-            new_text = r2.choices[0].message.content.strip()
-            w2 = count_words(new_text)
-            if w2 >= min_len:
-                final_text = new_text
-                break
-            else:
-                final_text = new_text
-                wcount = w2
-    return final_text
-
-def check_blacklist_and_rewrite(text, blacklist_words, max_tries=2):
-    if not blacklist_words.strip():
-        return text
-
-    words_list = [w.strip().lower() for w in blacklist_words.split(",") if w.strip()]
-
-    def contains_blacklist(t):
-        lower_t = t.lower()
-        for w in words_list:
-            if w in lower_t:
-                return True
-        return False
-
-    final_text = text
-    for attempt in range(max_tries):
-        if not contains_blacklist(final_text):
-            break
-        found = []
-        low = final_text.lower()
-        for w in words_list:
-            if w in low:
-                found.append(w)
-        rewrite_prompt = (
-            f"Nogle forbudte ord blev brugt: {found}. Fjern eller omformuler dem, "
-            "uden at forkorte teksten væsentligt:\n\n" +
-            final_text
-        )
-        r3 = openai.ChatCompletion.create(
-            model="gpt-4-turbo",
-            messages=[{"role": "user", "content": rewrite_prompt}],
-            max_tokens=max(300, len(final_text.split()) * 4)
-        )
-        final_text = r3.choices[0].message.content.strip()
-    return final_text
+        st.error(f"Fejl ved produktlinks: {e}")
+        return []
 
-# -- NYE FUNKTIONER TIL MULTI-AGENT PROCESSEN --
+@st.cache_data(max_entries=4)
+def load_table(file_digest, _data, filename):
+    return read_table(_data, filename)
 
-def generate_initial_draft(prompt, min_len=700, max_tries=3):
-    return generate_iterative_seo_text(prompt, min_len, max_tries)
-
-def humanize_text(text):
-    humanize_prompt = (
-        "Forbedr følgende tekst, så den lyder mere naturlig og menneskelig, "
-        "og juster tone og flow uden at ændre på det centrale indhold:\n\n" + text
-    )
-    response = openai.ChatCompletion.create(
-        model="gpt-4-turbo",
-        messages=[{"role": "user", "content": humanize_prompt}],
-        max_tokens=max(300, len(text.split()) * 4)
-    )
-    return response.choices[0].message.content.strip()
-
-def enhance_seo_text(text, rel_soegeord, extra_instructions):
-    seo_prompt = (
-        "Forbedr SEO-optimeringen af følgende tekst ved at integrere de relaterede søgeord: " + rel_soegeord + ". " +
-        extra_instructions +
-        "Husk at teksten skal forblive en sammenhængende artikel på mindst det angivne antal ord. " +
-        "Her er teksten:\n\n" + text
-    )
-    response = openai.ChatCompletion.create(
-        model="gpt-4-turbo",
-        messages=[{"role": "user", "content": seo_prompt}],
-        max_tokens=max(300, len(text.split()) * 4)
-    )
-    return response.choices[0].message.content.strip()
+@st.cache_resource
+def get_enrichment_cache():
+    return EnrichmentCache()
 
 # -- SIDEBAR
 st.sidebar.header("Navigation")
 if st.sidebar.button("Skriv SEO-tekst"):
-    st.session_state["page"] = "seo"
-    save_state()
+    remember("page", "seo")
 
 st.sidebar.markdown("---")
 st.sidebar.header("Virksomhedsprofiler")
 
-pnames = list(st.session_state["profiles"].keys())
+pnames = store.profile_names()
 for nm in pnames:
     c1, c2 = st.sidebar.columns([4, 1])
     with c1:
         if st.button(nm, key=f"pf_{nm}"):
-            st.session_state["current_profile"] = nm
-            st.session_state["page"] = "profil"
-            save_state()
+            remember("current_profile", nm)
+            remember("page", "profil")
     with c2:
         if st.button("🗑", key=f"del_{nm}"):
             st.session_state["delete_profile"] = nm
-            save_state()
 
 if st.session_state.get("delete_profile"):
     prof_del = st.session_state["delete_profile"]
@@ -272,27 +112,22 @@ if st.session_state.get("delete_profile"):
     cc1, cc2 = st.sidebar.columns(2)
     with cc1:
         if st.button("Ja, slet"):
-            st.session_state["profiles"].pop(prof_del, None)
+            store.delete_profile(prof_del)
             if st.session_state["current_profile"] == prof_del:
-                st.session_state["current_profile"] = "Standard profil"
+                remember("current_profile", DEFAULT_PROFILE)
             st.session_state["delete_profile"] = None
-            save_state()
     with cc2:
         if st.button("Nej"):
             st.session_state["delete_profile"] = None
-            save_state()
 
 if st.sidebar.button("Opret ny profil"):
     newp = f"Ny profil {len(pnames) + 1}"
-    st.session_state["profiles"][newp] = {"brand_profile": "", "blacklist": "", "produkt_info": ""}
-    st.session_state["current_profile"] = newp
-    st.session_state["page"] = "profil"
-    save_state()
-
-cur_data = st.session_state["profiles"].get(
-    st.session_state["current_profile"],
-    {"brand_profile": "", "blacklist": "", "produkt_info": ""}
-)
+    store.save_profile(newp)
+    remember("current_profile", newp)
+    remember("page", "profil")
+
+cur_name = st.session_state["current_profile"]
+cur_data = store.get_profile(cur_name)
 
 if cur_data.get("brand_profile", "").strip():
     st.sidebar.markdown(cur_data["brand_profile"])
@@ -300,54 +135,54 @@ else:
     st.sidebar.info("Ingen virksomhedsprofil fundet.")
 
 if not st.session_state.get("page"):
-    st.session_state["page"] = "profil"
-    save_state()
+    remember("page", "profil")
 
 # ==== PROFIL-SIDE ====
 if st.session_state["page"] == "profil":
     st.header("Redigér virksomhedsprofil")
 
-    cpname = st.text_input("Navn på virksomhedsprofil", value=st.session_state["current_profile"])
-    if cpname != st.session_state["current_profile"]:
-        oldn = st.session_state["current_profile"]
-        if cpname.strip():
-            st.session_state["profiles"][cpname] = st.session_state["profiles"].pop(oldn)
-            st.session_state["current_profile"] = cpname
-            cur_data = st.session_state["profiles"][cpname]
-            save_state()
+    cpname = st.text_input("Navn på virksomhedsprofil", value=cur_name)
+    if cpname != cur_name and cpname.strip():
+        if store.rename_profile(cur_name, cpname):
+            remember("current_profile", cpname)
+            cur_name = cpname
+            cur_data = store.get_profile(cpname)
+        else:
+            st.error(f"Der findes allerede en profil med navnet '{cpname}'.")
 
     # Hent AI-genereret brandprofil
     st.subheader("Hent AI-genereret brandprofil (uden 'bæredygtighed')")
     links_text = st.text_area("Indsæt ét link pr. linje til sider med virksomhedsinfo")
     if st.button("Generér brandprofil"):
-        lines = links_text.strip().split("\n")
-        all_content = ""
-        for line in lines:
-            line = line.strip()
-            if line:
-                page_txt = fetch_website_content(line)
-                if page_txt:
-                    all_content += f"\n\n=== KILDE: {line} ===\n{page_txt}"
+        lines = [line.strip() for line in links_text.strip().split("\n") if line.strip()]
+        pages = fetch_pages(lines, page_text, "Henter sider")
+        all_content = "".join(
+            f"\n\n=== KILDE: {line} ===\n{pages[line]}" for line in lines if pages.get(line)
+        )
         if all_content.strip():
             brand_prompt = (
                 "Her er tekst fra flere links. Lav en fyldig virksomhedsprofil "
                 "uden at nævne 'bæredygtighed'. Returnér KUN selve profilteksten.\n\n" +
-                all_content[:12000]
+                select_context(all_content, BRAND_QUERY, BRAND_SOURCE_TOKENS)
             )
-            try:
-                rp = openai.ChatCompletion.create(
-                    model="gpt-4-turbo",
-                    messages=[{"role": "user", "content": brand_prompt}],
-                    max_tokens=2000
-                )
-                brandp = rp.choices[0].message.content.strip()
-                st.session_state["profiles"][st.session_state["current_profile"]]["brand_profile"] = brandp
-                cur_data["brand_profile"] = brandp
-                save_state()
-                st.success("Virksomhedsprofil opdateret!")
-                st.text_area("Virksomhedsprofil (AI)", brandp, height=150)
-            except Exception as e:
-                st.error(f"Fejl ved AI: {e}")
+            with traced_run("brandprofil") as run:
+                try:
+                    # Et nyt klik skal give en ny profil, ikke det cachede svar
+                    rp = llm_gateway.complete(
+                        "brandprofil",
+                        dedupe=False,
+                        model="gpt-4-turbo",
+                        messages=[{"role": "user", "content": brand_prompt}],
+                        max_tokens=2000
+                    )
+                    brandp = rp.choices[0].message.content.strip()
+                    store.save_profile(cur_name, brand_profile=brandp)
+                    cur_data["brand_profile"] = brandp
+                    st.success("Virksomhedsprofil opdateret!")
+                    st.text_area("Virksomhedsprofil (AI)", brandp, height=150)
+                except Exception as e:
+                    st.error(f"Fejl ved AI: {e}")
+            show_run_summary(run)
         else:
             st.warning("Fandt ingen tekst ved link(s).")
 
@@ -369,15 +204,28 @@ if st.session_state["page"] == "profil":
             if cv:
                 chosen.append(lnk)
         if st.button("Hent valgte (auto-berig)"):
-            big_raw = ""
-            for c_link in chosen:
-                rawp = fetch_product_text_raw(c_link)
-                big_raw += f"\n\n=== PRODUKT ===\n{c_link}\n{rawp}"
-            if big_raw.strip():
-                final = automatically_enrich_product_text(big_raw)
-                st.session_state["profiles"][st.session_state["current_profile"]]["produkt_info"] = final
+            products = fetch_pages(chosen, product_text, "Henter produkter")
+            pending = [(c_link, products[c_link]) for c_link in chosen if products.get(c_link, "").strip()]
+            if pending:
+                # Hvert produkt beriges for sig; uændrede produkter hentes fra cachen
+                enriched = {}
+                cached = 0
+                bar = st.progress(0.0, text="Beriger produkter")
+                with traced_run("berigelse") as run:
+                    for n, (c_link, text, err, from_cache) in enumerate(
+                        enrich_products(pending, get_enrichment_cache()), start=1
+                    ):
+                        if err is not None:
+                            st.error(f"Fejl ved berigelse af {c_link}: {err}")
+                        enriched[c_link] = text
+                        cached += from_cache
+                        bar.progress(n / len(pending), text=f"Beriger produkter ({n}/{len(pending)})")
+                bar.empty()
+                show_run_summary(run)
+                st.info(f"{len(pending) - cached} produkter beriget, {cached} uændrede hentet fra cache.")
+                final = build_product_info(chosen, enriched)
+                store.save_profile(cur_name, produkt_info=final)
                 cur_data["produkt_info"] = final
-                save_state()
                 st.success("Produktinfo hentet + beriget!")
                 st.text_area("Produktinfo", final, height=300)
             else:
@@ -386,31 +234,29 @@ if st.session_state["page"] == "profil":
     st.subheader("Virksomhedsprofil (manuel redigering)")
     brand_man = st.text_area("Indtast eller rediger virksomhedsprofil", cur_data.get("brand_profile", ""), height=100)
     if st.button("Gem virksomhedsprofil (manuel)"):
-        st.session_state["profiles"][st.session_state["current_profile"]]["brand_profile"] = brand_man
+        store.save_profile(cur_name, brand_profile=brand_man)
         cur_data["brand_profile"] = brand_man
-        save_state()
         st.success("Virksomhedsprofil gemt")
     
     # --- Nyt blacklist-felt ---
     st.subheader("Blacklist (forbudte ord)")
     default_blacklist = str(cur_data.get("blacklist") or "")
     blacklist_text = st.text_area(
-        "Indtast kommaseparerede ord, der ikke må indgå i SEO-teksten.",
+        "Indtast kommaseparerede ord, der ikke må indgå i SEO-teksten. Afslut et ord med * "
+        "for at forbyde alle ord der begynder med det.",
         value=default_blacklist,
         height=68
     )
     if st.button("Gem blacklist"):
-        st.session_state["profiles"][st.session_state["current_profile"]]["blacklist"] = blacklist_text
+        store.save_profile(cur_name, blacklist=blacklist_text)
         cur_data["blacklist"] = blacklist_text
-        save_state()
         st.success("Blacklist gemt")
 
     st.subheader("Produktinfo (manuel)")
     prod_man = st.text_area("Indtast eller rediger produktinfo", cur_data.get("produkt_info", ""), height=150)
     if st.button("Gem produktinfo (manuel)"):
-        st.session_state["profiles"][st.session_state["current_profile"]]["produkt_info"] = prod_man
+        store.save_profile(cur_name, produkt_info=prod_man)
         cur_data["produkt_info"] = prod_man
-        save_state()
         st.success("Produktinfo gemt")
 
     st.markdown("---")
@@ -418,30 +264,41 @@ if st.session_state["page"] == "profil":
     upf = st.file_uploader("Vælg fil", type=["csv", "xlsx", "pdf"])
     if upf:
         st.write(f"Filen {upf.name} uploadet.")
-        extracted = ""
-        if upf.name.endswith(".csv"):
-            df = pd.read_csv(upf)
-            extracted = df.to_string(index=False)
-        elif upf.name.endswith(".xlsx"):
-            df = pd.read_excel(upf)
-            extracted = df.to_string(index=False)
-        elif upf.name.endswith(".pdf"):
-            reader = PyPDF2.PdfReader(upf)
-            for pg in reader.pages:
-                extracted += pg.extract_text()
-        st.session_state["profiles"][st.session_state["current_profile"]]["produkt_info"] = extracted
-        cur_data["produkt_info"] = extracted
-        save_state()
-        st.success("Data gemt i produktinfo.")
+        raw = upf.getvalue()
+        file_digest = digest(raw)
+        extracted = None
+        if upf.name.lower().endswith(".pdf"):
+            bar = st.progress(0.0, text="Udtrækker sider")
+
+            def on_progress(done, total):
+                bar.progress(done / total, text=f"Udtrækker sider ({done}/{total})")
+
+            extracted, from_cache = cached(file_digest, "pdf", lambda: extract_pdf(raw, on_progress=on_progress))
+            bar.empty()
+        else:
+            df = load_table(file_digest, raw, upf.name)
+            columns = st.multiselect(
+                "Kolonner der skal med i produktinfo", list(df.columns), default=suggest_columns(df)
+            )
+            if columns:
+                extracted, from_cache = cached(
+                    file_digest, "table:" + "\x1f".join(map(str, columns)), lambda: compact_table(df, columns)
+                )
+        if extracted is not None:
+            st.caption(
+                f"{len(extracted.splitlines())} linjer, ca. {estimate_tokens(extracted)} tokens"
+                + (" (fra cache)" if from_cache else "")
+            )
+            if st.button("Gem i produktinfo"):
+                store.save_profile(cur_name, produkt_info=extracted)
+                cur_data["produkt_info"] = extracted
+                st.success("Data gemt i produktinfo.")
 
 # ---- SEO-SIDE ----
 elif st.session_state["page"] == "seo":
     st.header("Generér SEO-tekst (HTML + forhåndsvisning)")
 
-    data = st.session_state["profiles"].get(
-        st.session_state["current_profile"],
-        {"brand_profile": "", "blacklist": "", "produkt_info": ""}
-    )
+    data = cur_data
 
     st.write("Virksomhedsprofil:")
     st.markdown(data.get("brand_profile", "(ingen)"))
@@ -465,59 +322,94 @@ elif st.session_state["page"] == "seo":
 
     seo_key = st.text_input("Hoved-søgeord / emne", "")
     antal = st.selectbox("Antal SEO-tekster", list(range(1, 11)), 0)
+    workers = st.slider("Samtidige artikler", 1, 10, ARTICLE_WORKERS,
+                        help="Artiklerne deler samme rate limit, så flere samtidige kald ikke giver flere 429-fejl.")
+    cmode, cstream = st.columns(2)
+    with cmode:
+        mode = st.radio(
+            "Pipeline",
+            ["Fire trin (udkast → humanisering → SEO → blacklist)", "Samlet i ét kald"],
+            help="Samlet tilstand skriver en naturlig, SEO-optimeret tekst i ét kald og bruger færre tokens."
+        )
+    with cstream:
+        stream = st.checkbox("Vis teksten mens den skrives", value=True)
+        outline = st.checkbox(
+            "Disposition først (afsnit skrives parallelt)",
+            help="Laver en disposition med ordbudget pr. afsnit og skriver afsnittene samtidigt, "
+                 "så lange tekster når min. ordlængde uden ekstra udvidelsesrunder."
+        )
 
     if seo_key:
         if st.button("Generér SEO-tekst"):
-            with st.spinner("Genererer SEO-tekst..."):
-                for i in range(antal):
-                    # Byg basisprompt til hovedartiklen
-                    base_prompt = (
-                        f"Skriv en komplet, sammenhængende SEO-optimeret artikel på dansk om '{seo_key}' "
-                        f"med fokus på {formaal}. Artiklen skal være skrevet for en målgruppe af {malgruppe} "
-                        f"og have en {tone.lower()} tone-of-voice. Brug følgende information fra brandprofil og produktinfo: "
-                        f"{data.get('brand_profile', '')} {data.get('produkt_info', '')}. "
-                        f"Artiklen skal være på mindst {min_len} ord og dække emnet grundigt. "
-                        f"Relaterede søgeord: {rel_soegeord}.\n"
-                        "Returnér hele teksten i HTML med passende overskrifter (<h2>, <h3>, <h4>). "
-                        "Husk at teksten skal være sammenhængende og fyldig."
-                    )
-                    
-                    # Saml ekstra instruktioner, hvis valgmulighederne er markeret
-                    extra_instructions = ""
-                    if inc_faq:
-                        extra_instructions += "Tilføj en FAQ-sektion med mindst 3 spørgsmål. "
-                    if inc_meta:
-                        extra_instructions += "Tilføj meta-titel (60 tegn) og meta-beskrivelse (160 tegn). "
-                    if inc_links:
-                        extra_instructions += "Tilføj mindst 2 interne links. "
-                    if inc_cta:
-                        extra_instructions += "Afslut med en tydelig CTA. "
-                    
-                    # 1) Generer første udkast af hovedartiklen
-                    initial_draft = generate_initial_draft(base_prompt, min_len=min_len)
-                    # 2) Humaniser teksten
-                    humanized = humanize_text(initial_draft)
-                    # 3) Forfin SEO-elementerne med de ekstra instruktioner, uden at gå på kompromis med længden
-                    enhanced_seo = enhance_seo_text(humanized, rel_soegeord, extra_instructions)
-                    # 4) Kør blacklist-check
-                    final_txt = check_blacklist_and_rewrite(enhanced_seo, data.get("blacklist", ""), max_tries=2)
-                    
-                    st.session_state["generated_texts"].append(final_txt)
-            save_state()
-
-            if st.session_state["generated_texts"]:
-                st.subheader("Dine SEO-tekster - forhåndsvisning (HTML)")
-                cpy = st.session_state["generated_texts"][:]
-                for idx, doc in enumerate(cpy):
-                    with st.expander(f"SEO-tekst {idx+1}"):
-                        st.markdown(doc, unsafe_allow_html=True)
-                        st.download_button(
-                            label=f"Download SEO {idx+1} (HTML)",
-                            data=doc,
-                            file_name=f"seo_{idx+1}.html",
-                            mime="text/html"
-                        )
-                        if st.button(f"Slet tekst {idx+1}", key=f"del_{idx}"):
-                            st.session_state["generated_texts"].pop(idx)
-                            save_state()
-                            st.experimental_rerun()
+            with traced_run("seo-tekster") as run:
+                # Kun de dele af brandprofil og produktinfo der er relevante for søgeordene
+                query = f"{seo_key} {rel_soegeord}"
+                brand_ctx = select_context(data.get('brand_profile', ''), query, BRAND_CONTEXT_TOKENS)
+                product_ctx = select_context(data.get('produkt_info', ''), query, PRODUCT_CONTEXT_TOKENS)
+                st.caption(
+                    f"Kontekst i prompten: {estimate_tokens(brand_ctx) + estimate_tokens(product_ctx)} af "
+                    f"{estimate_tokens(data.get('brand_profile', '')) + estimate_tokens(data.get('produkt_info', ''))} "
+                    "tokens fra brandprofil og produktinfo"
+                )
+                base_prompt = build_base_prompt(
+                    seo_key, formaal, malgruppe, tone,
+                    brand_ctx, product_ctx,
+                    min_len, rel_soegeord
+                )
+                extra_instructions = build_extra_instructions(inc_faq, inc_meta, inc_links, inc_cta)
+
+                # Én statuslinje pr. artikel; færdige artikler vises med det samme
+                live = st.empty()
+                with live.container():
+                    slots = [st.empty() for _ in range(antal)]
+
+                def show_status(status, texts):
+                    for i, stage in status.items():
+                        if stage in ("færdig", "fejl"):
+                            continue
+                        with slots[i].container():
+                            st.info(f"Artikel {i+1}: {stage} …")
+                            if texts.get(i):
+                                st.markdown(texts[i], unsafe_allow_html=True)
+
+                show_status({i: "i kø" for i in range(antal)}, {})
+                errors = []
+                for i, final_txt, err in generate_articles(
+                    antal, base_prompt, min_len, rel_soegeord, extra_instructions,
+                    data.get("blacklist", ""), workers=workers, on_poll=show_status,
+                    stream=stream, fused=mode == "Samlet i ét kald", outline=outline
+                ):
+                    if err is not None:
+                        errors.append(f"Artikel {i+1} fejlede: {err}")
+                        slots[i].error(errors[-1])
+                        continue
+                    store.add_text(final_txt, profile=cur_name)
+                    with slots[i].container():
+                        with st.expander(f"Artikel {i+1} færdig ({len(final_txt.split())} ord)"):
+                            st.markdown(final_txt, unsafe_allow_html=True)
+                # Batchen er færdig; alle tekster vises i listen nedenfor
+                live.empty()
+                for msg in errors:
+                    st.error(msg)
+            show_run_summary(run)
+
+    # Tidligere tekster vises side for side; brødteksten hentes kun for den viste side
+    total_texts = store.count_texts()
+    if total_texts:
+        st.subheader("Dine SEO-tekster - forhåndsvisning (HTML)")
+        pages = (total_texts - 1) // TEXTS_PER_PAGE + 1
+        page_no = st.number_input(f"Side (af {pages})", min_value=1, max_value=pages, value=1, step=1)
+        for meta in store.list_texts((page_no - 1) * TEXTS_PER_PAGE, TEXTS_PER_PAGE):
+            tid = meta["id"]
+            with st.expander(f"SEO-tekst {tid} ({meta['words']} ord)"):
+                doc = store.get_text(tid) or ""
+                st.markdown(doc, unsafe_allow_html=True)
+                st.download_button(
+                    label=f"Download SEO {tid} (HTML)",
+                    data=doc,
+                    file_name=f"seo_{tid}.html",
+                    mime="text/html"
+                )
+                if st.button(f"Slet tekst {tid}", key=f"del_text_{tid}"):
+                    store.delete_text(tid)
+                    st.rerun()
@@ -0,0 +1,22 @@
+"""Fælles Streamlit-hjælpere for SEO-appen og CSV-oversætteren."""
+import uuid
+
+import pandas as pd
+import streamlit as st
+
+import llm_gateway
+
+
+def start_gateway_session():
+    """Giver browsersessionen sit eget id i gatewayen, så kald fordeles retfærdigt mellem sessionerne."""
+    if "gateway_session" not in st.session_state:
+        st.session_state["gateway_session"] = uuid.uuid4().hex
+    llm_gateway.set_session(st.session_state["gateway_session"])
+
+
+def show_run_summary(run):
+    """Viser latens, tokens, retries og pris pr. stage for en kørsel."""
+    rows = run.summary()
+    if rows:
+        with st.expander("📊 LLM-forbrug for denne kørsel"):
+            st.dataframe(pd.DataFrame(rows), hide_index=True)
@@ -0,0 +1,274 @@
+"""Offline throughput-benchmarks for CSV-oversætteren og SEO-pipelinen.
+
+Kører mod mock_openai_server (startes automatisk i processen, medmindre
+--api-base peger på en kørende server), så der ikke bruges rigtige API-kald.
+
+Eksempler:
+    python benchmark.py translator --rows 5000 --workers 16
+    python benchmark.py seo --articles 5 --min-len 700 --short-ratio 0.6
+    python benchmark.py seo --articles 10 --article-workers 1   # sekventiel reference
+    python benchmark.py seo --fused --stream --tokens-per-second 50   # ét kald pr. artikel, streamet
+    python benchmark.py seo --min-len 1800 --short-ratio 0.6 --outline   # disposition + parallelle afsnit
+    python benchmark.py all --out bench_results.jsonl
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+import openai
+import pandas as pd
+import requests
+
+import llm_gateway
+from llm_metrics import traced_run
+from mock_openai_server import start_server
+from seo_pipeline import ARTICLE_WORKERS, build_base_prompt, build_extra_instructions, generate_articles
+from shopify_translator import resolve_locales, translate_file
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * p / 100
+    lo = int(k)
+    hi = min(lo + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+class CallTimer:
+    """Måler latens pr. ChatCompletion-kald (inkl. fejlede kald) under en benchmark."""
+
+    def __init__(self):
+        self.latencies = []
+        self.lock = threading.Lock()
+        self._original = None
+
+    def __enter__(self):
+        self._original = openai.ChatCompletion.create
+        original = self._original
+
+        def timed(*args, **kwargs):
+            started = time.monotonic()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                with self.lock:
+                    self.latencies.append(time.monotonic() - started)
+
+        openai.ChatCompletion.create = timed
+        return self
+
+    def __exit__(self, *exc):
+        openai.ChatCompletion.create = self._original
+
+
+def make_synthetic_export(path, rows, locales, duplicate_ratio=0.5, html_ratio=0.25, seed=0):
+    """Skriver en syntetisk Shopify translation-CSV med en blanding af felter og dubletter."""
+    rnd = random.Random(seed)
+    fields = ["title", "meta_title", "meta_description", "option1", "body_html", "handle"]
+    shared = [f"Fælles tekst {i}" for i in range(20)]
+    records = []
+    for i in range(rows):
+        field = "body_html" if rnd.random() < html_ratio else rnd.choice(fields[:4] + fields[5:])
+        if field == "handle":
+            content = f"produkt-{i}"
+        elif field == "body_html":
+            content = (
+                f"<div class=\"rte\"><h2>Produkt {i % 200}</h2><p>Flot <strong>egetræsbord</strong> "
+                f"med plads til {i % 12} personer.</p><img src=\"https://cdn.example.com/{i}.jpg\"></div>"
+            )
+        elif rnd.random() < duplicate_ratio:
+            content = rnd.choice(shared)
+        else:
+            content = f"Unik tekst nummer {i}"
+        records.append({
+            "Type": "PRODUCT",
+            "Identification": f"'{1000 + i // len(locales)}",
+            "Field": field,
+            "Locale": locales[i % len(locales)],
+            "Market": "",
+            "Status": "",
+            "Default content": content,
+            "Translated content": "",
+        })
+    pd.DataFrame(records).to_csv(path, index=False)
+
+
+def server_stats(api_base, server=None):
+    if server is not None:
+        return server.state.snapshot()
+    return requests.get(api_base.rstrip("/") + "/stats", timeout=5).json()
+
+
+def reset_server(api_base, server=None):
+    if server is not None:
+        server.state.reset()
+    else:
+        requests.post(api_base.rstrip("/") + "/reset", timeout=5)
+
+
+def bench_translator(args, api_base, server=None):
+    locales = args.locales.split(",")
+    folder = tempfile.mkdtemp(prefix="bench_translator_")
+    input_path = os.path.join(folder, "input.csv")
+    output_path = os.path.join(folder, "output.csv")
+    make_synthetic_export(input_path, args.rows, locales, args.duplicate_ratio, seed=args.seed)
+    reset_server(api_base, server)
+
+    with CallTimer() as timer:
+        started = time.monotonic()
+        stats = translate_file(
+            input_path, output_path, "mock", resolve_locales(locales),
+            resume=False,
+            workers=args.workers,
+            rpm=args.rpm,
+            tpm=args.tpm,
+            use_memory=False,
+            batch_tokens=args.batch_tokens,
+            fanout=args.fanout,
+            html_segments=args.html_segments,
+        )
+        elapsed = time.monotonic() - started
+
+    mock = server_stats(api_base, server)
+    return {
+        "benchmark": "translator",
+        "rows": args.rows,
+        "rows_translated": stats["rows"],
+        "elapsed": elapsed,
+        "rows_per_second": args.rows / elapsed if elapsed else 0.0,
+        "requests": mock["requests"],
+        "rate_limited": mock["rate_limited"],
+        "tokens": mock["total_tokens"],
+        "p50_latency": percentile(timer.latencies, 50),
+        "p95_latency": percentile(timer.latencies, 95),
+        "settings": {
+            "workers": args.workers, "batch_tokens": args.batch_tokens,
+            "fanout": args.fanout, "html_segments": args.html_segments,
+        },
+    }
+
+
+def bench_seo(args, api_base, server=None):
+    reset_server(api_base, server)
+    base_prompt = build_base_prompt(
+        "spisebord i egetræ", "Salg/landingsside", "B2C (forbrugere)", "Venlig",
+        "Et dansk møbelfirma med fokus på håndværk.", "Spisebord, massiv eg, 200 cm.",
+        args.min_len, "plankebord, egetræsbord"
+    )
+    extra = build_extra_instructions(True, True, False, True)
+
+    # Tid fra start til hver artikel er klar (det brugeren venter på)
+    article_times = []
+    with CallTimer() as timer, traced_run("benchmark-seo") as run:
+        started = time.monotonic()
+        for _, _, err in generate_articles(
+            args.articles, base_prompt, args.min_len, "plankebord, egetræsbord", extra, args.blacklist,
+            workers=args.article_workers, stream=args.stream, fused=args.fused,
+            outline=args.outline
+        ):
+            if err is not None:
+                raise err
+            article_times.append(time.monotonic() - started)
+        elapsed = time.monotonic() - started
+
+    mock = server_stats(api_base, server)
+    # Ved streaming måler CallTimer kun til svaret starter; latensen fra kørslen er hele kaldet
+    total = run.summary()[-1]
+    return {
+        "benchmark": "seo",
+        "articles": args.articles,
+        "elapsed": elapsed,
+        "articles_per_minute": args.articles / elapsed * 60 if elapsed else 0.0,
+        "requests": mock["requests"],
+        "rate_limited": mock["rate_limited"],
+        "tokens": mock["total_tokens"],
+        "completion_tokens": mock["completion_tokens"],
+        "p50_latency": percentile(timer.latencies, 50),
+        "p95_latency": percentile(timer.latencies, 95),
+        "avg_call_latency": total["latency_avg"],
+        "ttft_avg": total["ttft_avg"] or 0.0,
+        "first_article": article_times[0] if article_times else 0.0,
+        "p50_article": percentile(article_times, 50),
+        "settings": {"min_len": args.min_len, "blacklist": args.blacklist, "article_workers": args.article_workers,
+                     "fused": args.fused, "stream": args.stream, "outline": args.outline},
+    }
+
+
+def format_result(result):
+    lines = [f"== {result['benchmark']} =="]
+    for k, v in result.items():
+        if k in ("benchmark", "settings"):
+            continue
+        lines.append(f"  {k:<20} {v:.3f}" if isinstance(v, float) else f"  {k:<20} {v}")
+    lines.append(f"  settings             {json.dumps(result['settings'], ensure_ascii=False)}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmarks mod en lokal mock af OpenAI.")
+    parser.add_argument("suite", choices=["translator", "seo", "all"])
+    parser.add_argument("--api-base", help="Brug en allerede kørende mock-server (fx http://127.0.0.1:8100/v1)")
+    parser.add_argument("--latency", type=float, default=0.05, help="Mock-latens pr. kald i sekunder")
+    parser.add_argument("--jitter", type=float, default=0.02)
+    parser.add_argument("--tokens-per-second", type=float, default=0.0)
+    parser.add_argument("--rate-429", type=float, default=0.0)
+    parser.add_argument("--short-ratio", type=float, default=1.0, help="Længde af første SEO-udkast ift. min. længde")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="Tilføj resultaterne som JSON-linjer til denne fil")
+    # Oversætter
+    parser.add_argument("--rows", type=int, default=2000)
+    parser.add_argument("--locales", default="en,de,fr,sv,no")
+    parser.add_argument("--duplicate-ratio", type=float, default=0.5)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--rpm", type=int, default=100000)
+    parser.add_argument("--tpm", type=int, default=100000000)
+    parser.add_argument("--batch-tokens", type=int, default=2000)
+    parser.add_argument("--fanout", action="store_true")
+    parser.add_argument("--html-segments", action="store_true")
+    # SEO
+    parser.add_argument("--articles", type=int, default=3)
+    parser.add_argument("--article-workers", type=int, default=ARTICLE_WORKERS, help="Samtidige artikler (1 = sekventielt)")
+    parser.add_argument("--min-len", type=int, default=700)
+    parser.add_argument("--blacklist", default="kvalitet, tidløs")
+    parser.add_argument("--fused", action="store_true", help="Udkast, humanisering og SEO i ét kald")
+    parser.add_argument("--stream", action="store_true", help="Stream svarene (måler tid til første token)")
+    parser.add_argument("--outline", action="store_true", help="Disposition først og afsnit skrevet parallelt")
+    args = parser.parse_args(argv)
+
+    server = None
+    api_base = args.api_base
+    if not api_base:
+        server, api_base = start_server(
+            latency=args.latency, jitter=args.jitter, tokens_per_second=args.tokens_per_second,
+            rate_429=args.rate_429, short_ratio=args.short_ratio, seed=args.seed
+        )
+    openai.api_base = api_base
+    openai.api_key = "mock"
+    llm_gateway.configure(concurrency=max(args.workers, args.article_workers), rpm=args.rpm, tpm=args.tpm)
+
+    results = []
+    if args.suite in ("translator", "all"):
+        results.append(bench_translator(args, api_base, server))
+    if args.suite in ("seo", "all"):
+        results.append(bench_seo(args, api_base, server))
+
+    for result in results:
+        print(format_result(result))
+    if args.out:
+        with open(args.out, "a", encoding="utf-8") as f:
+            for result in results:
+                f.write(json.dumps({"timestamp": time.time(), **result}, ensure_ascii=False) + "\n")
+    if server is not None:
+        server.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,185 @@
+"""Blacklist-matcher: finder forbudte ord (inkl. bøjede former) med præcise positioner.
+
+Ordene kompileres én gang pr. blacklist til en Aho-Corasick-automat, så teksten
+kun gennemløbes én gang uanset antallet af ord. Et fund tæller kun når det står
+som et helt ord, evt. med en dansk bøjnings- eller afledningsendelse ("ren"
+matcher "rene" og "renhed", "unik" matcher "unikke", men "ren" matcher ikke
+"grene"). I en frase må alle ordene være bøjede ("grøn omstilling" matcher
+"grønne omstilling"). Et ord der slutter med * matcher alle ord der begynder
+med det ("bæredygtig*" matcher også "bæredygtighedsmål").
+"""
+import functools
+import itertools
+import re
+from collections import deque, namedtuple
+
+from html_segments import MARKUP_RE, join_segments
+
+# Almindelige danske bøjningsendelser (navneord, tillægsord og udsagnsord)
+INFLECTIONS = frozenset((
+    "", "e", "n", "r", "s", "t", "en", "er", "et", "es", "ne", "re", "te", "st",
+    "ene", "ens", "ers", "ets", "ere", "est", "ede", "ende", "erne", "ernes",
+    "este", "ste", "rne",
+))
+# Afledningsendelser, der selv kan bøjes ("bæredygtig" → "bæredygtighed", "bæredygtigheden")
+DERIVATIONS = ("hed", "lig", "ning", "else", "isk", "skab", "dom")
+ENDINGS = INFLECTIONS | frozenset(d + i for d in DERIVATIONS for i in INFLECTIONS)
+CONSONANTS = frozenset("bcdfghjklmnpqrstvwxz")
+
+SENTENCE_SPLIT_RE = re.compile(r"(?<=[.!?])(?=\s)")
+
+Hit = namedtuple("Hit", "start end word")
+
+
+def _is_letter(ch):
+    return ch.isalnum() or ch == "_"
+
+
+def _lower(text):
+    """Små bogstaver med samme længde som input, så positioner passer."""
+    lowered = text.lower()
+    if len(lowered) == len(text):
+        return lowered
+    return "".join(c.lower() if len(c.lower()) == 1 else c for c in text)
+
+
+def _bent(word):
+    """`word` med alle bøjningsendelser, også med fordoblet slutkonsonant (grøn → grønne)."""
+    forms = {word + ending for ending in INFLECTIONS}
+    if word[-1:] in CONSONANTS:
+        forms.update(word + word[-1] + ending for ending in INFLECTIONS if ending)
+    return forms
+
+
+def _phrase_forms(phrase):
+    """En frase med bøjede former af alle ord undtagen det sidste, som find() selv bøjer."""
+    words = phrase.split(" ")
+    return [" ".join(forms) for forms in itertools.product(*map(_bent, words[:-1]), [words[-1]])]
+
+
+def parse_words(blacklist_words):
+    """Kommasepareret streng → unikke ord/fraser i små bogstaver (et evt. * bevares)."""
+    words = []
+    for w in (blacklist_words or "").split(","):
+        w = " ".join(w.split()).lower()
+        if w and w not in words:
+            words.append(w)
+    return words
+
+
+class BlacklistMatcher:
+    def __init__(self, words):
+        # "ord*" gemmes som "ord" og matcher enhver endelse
+        words = list(words)
+        self.prefixes = {n for n, w in enumerate(words) if w.endswith("*") and w.rstrip("*")}
+        self.words = [w.rstrip("*") if n in self.prefixes else w for n, w in enumerate(words)]
+        # Mønstrene er (tekst, ordnummer); en frase giver ét mønster pr. bøjning af de første ord
+        self._patterns = [(form, n) for n, word in enumerate(self.words) for form in _phrase_forms(word)]
+        # Automat: goto-tabel, fail-links og output (mønsternumre) pr. tilstand
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+        for p, (pattern, _) in enumerate(self._patterns):
+            state = 0
+            for ch in pattern:
+                nxt = self._goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[state][ch] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                state = nxt
+            self._out[state].append(p)
+
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                f = self._fail[state]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                self._fail[nxt] = self._goto[f].get(ch, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def __bool__(self):
+        return bool(self.words)
+
+    def find(self, text):
+        """Alle fund som Hit(start, end, word), hvor text[start:end] er hele det bøjede ord."""
+        if not self.words or not text:
+            return []
+        low = _lower(text)
+        hits = []
+        state = 0
+        for i, ch in enumerate(low):
+            while state and ch not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(ch, 0)
+            for p in self._out[state]:
+                pattern, n = self._patterns[p]
+                word = self.words[n]
+                start = i + 1 - len(pattern)
+                if start > 0 and _is_letter(low[start - 1]):
+                    continue
+                end = i + 1
+                while end < len(low) and _is_letter(low[end]):
+                    end += 1
+                ending = low[i + 1:end]
+                # Fordoblet slutkonsonant før endelsen: unik → unikke, grøn → grønne
+                if ending[:1] == word[-1] and word[-1] in CONSONANTS and ending[1:]:
+                    ending = ending[1:] if ending[1:] in ENDINGS else ending
+                if n in self.prefixes or ending in ENDINGS:
+                    hits.append(Hit(start, end, word))
+        # Længste fund først ved samme start, og ingen overlap
+        hits.sort(key=lambda h: (h.start, -h.end))
+        result = []
+        for hit in hits:
+            if not result or hit.start >= result[-1].end:
+                result.append(hit)
+        return result
+
+    def found_words(self, text):
+        return sorted({hit.word for hit in self.find(text)})
+
+
+@functools.lru_cache(maxsize=64)
+def compile_blacklist(blacklist_words):
+    """Kompileret matcher for en profils blacklist (genbruges så længe strengen er uændret)."""
+    return BlacklistMatcher(parse_words(blacklist_words))
+
+
+def split_sentences(html):
+    """Returnerer (dele, indeks): markup bevares som egne dele, tekstnoder deles i sætninger.
+
+    `indeks` peger på sætningerne, og "".join(dele) giver den oprindelige tekst.
+    """
+    parts = []
+    indices = []
+    for n, part in enumerate(MARKUP_RE.split(html)):
+        if n % 2:
+            parts.append(part)
+            continue
+        for sentence in SENTENCE_SPLIT_RE.split(part):
+            if sentence.strip():
+                indices.append(len(parts))
+            parts.append(sentence)
+    return parts, indices
+
+
+def sentences_with_hits(html, matcher):
+    """(dele, {indeks: [ord]}) for de sætninger der indeholder forbudte ord."""
+    parts, indices = split_sentences(html)
+    flagged = {}
+    for i in indices:
+        words = matcher.found_words(parts[i])
+        if words:
+            flagged[i] = words
+    return parts, flagged
+
+
+def replace_sentences(parts, replacements):
+    """Indsætter omskrevne sætninger ({indeks: tekst}) og bevarer whitespace omkring dem."""
+    indices = list(replacements)
+    return join_segments(parts, indices, [replacements[i] for i in indices])
@@ -0,0 +1,135 @@
+"""Lokalt BM25-indeks over profilens produktinfo og brandkilder.
+
+I stedet for at indsætte hele teksten i hver prompt (eller skære den af efter
+et fast antal tegn) deles den i bidder, og kun de bidder der er mest relevante
+for artiklens søgeord tages med, inden for et token-budget.
+"""
+import functools
+import math
+import re
+from collections import Counter
+
+from rate_limit import estimate_tokens
+
+CHUNK_TOKENS = 200
+PRODUCT_CONTEXT_TOKENS = 1500
+BRAND_CONTEXT_TOKENS = 800
+BRAND_SOURCE_TOKENS = 3000
+TOP_K = 12
+
+# Ord der bruges til at udvælge brandkilder, når der ikke er et søgeord
+BRAND_QUERY = (
+    "om os virksomhed historie værdier mission vision brand design håndværk "
+    "kvalitet kunder team grundlagt filosofi materialer produktion"
+)
+
+WORD_RE = re.compile(r"\w+")
+SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+SUFFIXES = ("ernes", "erne", "ene", "ere", "este", "est", "ens", "er", "en", "et", "e", "s")
+
+
+def stem(word):
+    """Meget let dansk stemming: fjerner én almindelig bøjningsendelse."""
+    for suffix in SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            return word[:-len(suffix)]
+    return word
+
+
+def tokenize(text):
+    return [stem(w) for w in WORD_RE.findall(text.lower())]
+
+
+def _section_header(lines):
+    """Ledende '=== … ==='-linjer og URL'er (fx produktets link) gentages i hver bid."""
+    n = 0
+    while n < len(lines) and (lines[n].startswith("===") or lines[n].startswith("http")):
+        n += 1
+    return "\n".join(lines[:n]), "\n".join(lines[n:])
+
+
+def chunk_text(text, max_tokens=CHUNK_TOKENS):
+    """Deler teksten i afsnit (tomme linjer) og lange afsnit yderligere i sætningsgrupper."""
+    chunks = []
+    for section in re.split(r"\n\s*\n", text or ""):
+        section = section.strip()
+        if not section:
+            continue
+        header, body = _section_header(section.split("\n"))
+        prefix = header + "\n" if header else ""
+        current = []
+        size = 0
+        for sentence in SENTENCE_RE.split(body):
+            tokens = estimate_tokens(sentence)
+            if current and size + tokens > max_tokens:
+                chunks.append(prefix + " ".join(current))
+                current, size = [], 0
+            current.append(sentence)
+            size += tokens
+        if current or header:
+            chunks.append(prefix + " ".join(current))
+    return chunks
+
+
+class BM25Index:
+    def __init__(self, chunks, k1=1.5, b=0.75):
+        self.chunks = list(chunks)
+        self.k1 = k1
+        self.b = b
+        self.terms = [Counter(tokenize(c)) for c in self.chunks]
+        self.lengths = [sum(t.values()) for t in self.terms]
+        self.avg_length = (sum(self.lengths) / len(self.lengths)) if self.lengths else 0.0
+        df = Counter()
+        for t in self.terms:
+            df.update(t.keys())
+        n = len(self.chunks)
+        self.idf = {term: math.log(1 + (n - f + 0.5) / (f + 0.5)) for term, f in df.items()}
+
+    def search(self, query, k=TOP_K):
+        """[(score, indeks)] for de `k` bedste bidder med score > 0."""
+        query_terms = set(tokenize(query))
+        scores = []
+        for i, terms in enumerate(self.terms):
+            norm = self.k1 * (1 - self.b + self.b * self.lengths[i] / (self.avg_length or 1))
+            score = 0.0
+            for term in query_terms:
+                tf = terms.get(term)
+                if tf:
+                    score += self.idf[term] * tf * (self.k1 + 1) / (tf + norm)
+            if score > 0:
+                scores.append((score, i))
+        scores.sort(key=lambda s: (-s[0], s[1]))
+        return scores[:k]
+
+
+@functools.lru_cache(maxsize=16)
+def build_index(text):
+    """Indekset genbruges så længe teksten er uændret (fx mellem artikler i samme batch)."""
+    return BM25Index(chunk_text(text))
+
+
+def select_context(text, query, token_budget, k=TOP_K):
+    """De mest relevante bidder af `text` for `query` inden for `token_budget`, i oprindelig rækkefølge.
+
+    Tekst der allerede kan være i budgettet returneres uændret.
+    """
+    text = (text or "").strip()
+    if estimate_tokens(text) <= token_budget:
+        return text
+    index = build_index(text)
+    chosen = []
+    used = 0
+    for _, i in index.search(query, k):
+        tokens = estimate_tokens(index.chunks[i])
+        if used + tokens > token_budget:
+            continue
+        chosen.append(i)
+        used += tokens
+    if not chosen:
+        # Ingen bidder matcher søgeordene: tag starten af teksten i stedet for ingenting
+        for i, chunk in enumerate(index.chunks):
+            used += estimate_tokens(chunk)
+            if used > token_budget:
+                break
+            chosen.append(i)
+    return "\n\n".join(index.chunks[i] for i in sorted(chosen))
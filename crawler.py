@@ -0,0 +1,186 @@
+"""Crawler til brand- og produktsider.
+
+Én delt requests.Session (forbindelsespulje), et begrænset antal samtidige
+hentninger pr. host og en HTTP-cache på disk, der bruger ETag/Last-Modified,
+så gentagne hentninger bliver betingede (304 Not Modified).
+"""
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urljoin, urlparse, urlunparse
+
+import requests
+from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+
+from storage import data_path
+
+USER_AGENT = "Mozilla/5.0 (compatible; SEO-generator)"
+PER_HOST = 4
+WORKERS = 16
+MAX_PAGES = 50
+
+
+def normalize_url(url):
+    """Tilføjer https:// hvis skemaet mangler (fx 'noyer.dk/collections/all')."""
+    url = url.strip()
+    if url and "://" not in url:
+        url = "https://" + url
+    return url
+
+
+def page_text(html):
+    """Sidens tekst uden script/style."""
+    soup = BeautifulSoup(html, "html.parser")
+    for s in soup(["script", "style"]):
+        s.decompose()
+    return soup.get_text(separator=' ', strip=True)
+
+
+def product_text(html):
+    """Produktbeskrivelsen, eller hele sidens tekst hvis temaet ikke har beskrivelsesfeltet."""
+    soup = BeautifulSoup(html, "html.parser")
+    desc = soup.select_one(".product-info__description")
+    if desc:
+        return desc.get_text(separator=' ', strip=True)
+    for s in soup(["script", "style"]):
+        s.decompose()
+    return soup.get_text(separator=' ', strip=True)
+
+
+def product_url(page_url, href):
+    """Absolut, kanonisk produkt-URL (/products/<handle>) eller None.
+
+    /collections/<x>/products/<handle> peger på samme produkt og samles derfor.
+    """
+    absolute = urlparse(urljoin(page_url, href))
+    if absolute.netloc != urlparse(page_url).netloc or "/products/" not in absolute.path:
+        return None
+    path = "/products/" + absolute.path.split("/products/", 1)[1].strip("/")
+    return urlunparse((absolute.scheme, absolute.netloc, path, "", "", ""))
+
+
+def next_page_url(page_url, soup):
+    """URL til næste side i en kollektion: rel="next" eller et ?page=N+1-link."""
+    tag = soup.find(["link", "a"], rel="next", href=True)
+    if tag:
+        return urljoin(page_url, tag["href"])
+    query = dict(p.split("=", 1) for p in urlparse(page_url).query.split("&") if "=" in p)
+    wanted = f"page={int(query.get('page', 1)) + 1}"
+    for a_tag in soup.find_all("a", href=True):
+        if wanted in urlparse(a_tag["href"]).query.split("&"):
+            return urljoin(page_url, a_tag["href"])
+    return None
+
+
+class HTTPCache:
+    """Svar med ETag/Last-Modified gemt som én JSON-fil pr. URL."""
+
+    def __init__(self, folder=None):
+        self.folder = folder or data_path("http_cache")
+        os.makedirs(self.folder, exist_ok=True)
+
+    def _path(self, url):
+        return os.path.join(self.folder, hashlib.sha256(url.encode("utf-8")).hexdigest() + ".json")
+
+    def get(self, url):
+        try:
+            with open(self._path(url), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def put(self, url, entry):
+        path = self._path(url)
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(tmp, path)
+
+
+class Crawler:
+    def __init__(self, per_host=PER_HOST, workers=WORKERS, timeout=10, cache=None, session=None):
+        self.per_host = max(1, int(per_host))
+        self.workers = max(1, int(workers))
+        self.timeout = timeout
+        self.cache = cache if cache is not None else HTTPCache()
+        self.session = session or requests.Session()
+        adapter = HTTPAdapter(pool_connections=self.workers, pool_maxsize=self.workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.setdefault("User-Agent", USER_AGENT)
+        self._hosts = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _host_slot(self, url):
+        host = urlparse(url).netloc
+        with self._lock:
+            if host not in self._hosts:
+                self._hosts[host] = threading.BoundedSemaphore(self.per_host)
+            return self._hosts[host]
+
+    def fetch(self, url):
+        """Henter en side som tekst (HTML). Bruger cachen med betinget GET når det er muligt."""
+        url = normalize_url(url)
+        cached = self.cache.get(url) if self.cache else None
+        headers = {}
+        if cached:
+            if cached.get("etag"):
+                headers["If-None-Match"] = cached["etag"]
+            if cached.get("last_modified"):
+                headers["If-Modified-Since"] = cached["last_modified"]
+        with self._host_slot(url):
+            r = self.session.get(url, headers=headers, timeout=self.timeout)
+        if r.status_code == 304 and cached:
+            with self._lock:
+                self.hits += 1
+            return cached["text"]
+        r.raise_for_status()
+        with self._lock:
+            self.misses += 1
+        etag = r.headers.get("ETag")
+        last_modified = r.headers.get("Last-Modified")
+        if self.cache and (etag or last_modified):
+            self.cache.put(url, {"url": url, "etag": etag, "last_modified": last_modified, "text": r.text})
+        return r.text
+
+    def fetch_many(self, urls, parse=None):
+        """Henter flere sider samtidigt og giver (url, indhold, fejl) efterhånden som de bliver færdige.
+
+        `parse(html)` køres i worker-tråden (fx page_text eller product_text).
+        """
+        def job(url):
+            html = self.fetch(url)
+            return parse(html) if parse else html
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            futures = {pool.submit(job, url): url for url in urls}
+            for future in as_completed(futures):
+                url = futures[future]
+                try:
+                    yield url, future.result(), None
+                except Exception as e:
+                    yield url, None, e
+
+    def product_links(self, collection_url, max_pages=MAX_PAGES):
+        """Alle produktlinks i en kollektion, på tværs af sider (rel="next"/?page=N)."""
+        links = []
+        seen_pages = set()
+        page = normalize_url(collection_url)
+        while page and page not in seen_pages and len(seen_pages) < max_pages:
+            seen_pages.add(page)
+            soup = BeautifulSoup(self.fetch(page), "html.parser")
+            new = 0
+            for a_tag in soup.find_all("a", href=True):
+                link = product_url(page, a_tag["href"])
+                if link and link not in links:
+                    links.append(link)
+                    new += 1
+            if not new:
+                break
+            page = next_page_url(page, soup)
+        return links
@@ -0,0 +1,85 @@
+"""Oversættelse af meget store Shopify-CSV'er i bidder, med output skrevet direkte til disk."""
+import os
+import shutil
+import tempfile
+
+import pandas as pd
+
+from translation_engine import clear_errors, translate_frame
+from translation_planner import rows_to_translate
+from translation_validation import validate_and_repair
+
+CHUNK_ROWS = 5000
+
+
+def save_upload(uploaded_file, folder=None):
+    """Kopierer en upload til `folder`/input.csv og returnerer stien.
+
+    Uden `folder` oprettes en ny midlertidig mappe; genbrug samme mappe pr.
+    session, så gamle uploads og resultater ikke hober sig op.
+    """
+    folder = folder or tempfile.mkdtemp(prefix="shopify_csv_")
+    path = os.path.join(folder, "input.csv")
+    uploaded_file.seek(0)
+    with open(path, "wb") as f:
+        shutil.copyfileobj(uploaded_file, f)
+    return path
+
+
+def read_locales(path):
+    """Læser kun Locale-kolonnen for at finde de sprog filen indeholder."""
+    locales = pd.read_csv(path, usecols=lambda c: c.strip() == "Locale")
+    locales.columns = locales.columns.str.strip()
+    return locales["Locale"].dropna().unique().tolist()
+
+
+def translate_csv_stream(input_path, output_path, engine, locales, chunk_rows=CHUNK_ROWS,
+                         on_progress=None, journal=None, validate=False, report=None, **kwargs):
+    """Oversætter `input_path` bid for bid og skriver hver bid til `output_path`.
+
+    Kun én bid ligger i hukommelsen ad gangen. `on_progress(andel)` kaldes med
+    andelen af inputfilen der er behandlet. Med `journal` springes rækker der
+    allerede er færdige over, og nye resultater skrives løbende til journalen.
+    Med `validate` kontrolleres de nye oversættelser i hver bid, fejlende rækker
+    oversættes igen, og rapporten pr. række føjes til listen `report`. Rækker der
+    stadig fejler, skrives tomme, så de oversættes igen næste gang.
+    Ekstra argumenter sendes videre til translate_frame. Returnerer samlet statistik.
+    """
+    size = os.path.getsize(input_path) or 1
+    # Journalen læses bid for bid, så hukommelsen ikke vokser med filen
+    offsets = journal.index(chunk_rows) if journal else {}
+    if journal:
+        kwargs["on_result"] = journal.record
+    stats = {}
+    first = True
+    with open(input_path, "rb") as src:
+        for chunk in pd.read_csv(src, chunksize=chunk_rows):
+            chunk.columns = chunk.columns.str.strip()
+            chunk["Translated content"] = chunk["Translated content"].astype(object)
+            chunk_offsets = offsets.pop(chunk.index[0] // chunk_rows, None) if len(chunk) else None
+            if chunk_offsets:
+                journal.apply(chunk, journal.load_at(chunk_offsets))
+            rows = rows_to_translate(chunk, locales)
+            chunk_stats = translate_frame(chunk, engine, locales, rows=rows, **kwargs)
+            if validate:
+                validation_stats, chunk_report = validate_and_repair(
+                    chunk, engine, locales, rows, memory=kwargs.get("memory"),
+                    batch_tokens=kwargs.get("batch_tokens", 0), on_result=kwargs.get("on_result")
+                )
+                chunk_stats.update(validation_stats)
+                if report is not None:
+                    report.extend(chunk_report)
+            clear_errors(chunk, rows)
+            for k, v in chunk_stats.items():
+                stats[k] = stats.get(k, 0) + v
+            chunk.to_csv(
+                output_path,
+                index=False,
+                header=first,
+                mode="w" if first else "a",
+                encoding="utf-8-sig" if first else "utf-8"
+            )
+            first = False
+            if on_progress:
+                on_progress(min(1.0, src.tell() / size))
+    return stats
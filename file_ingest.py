@@ -0,0 +1,137 @@
+"""Indlæsning af produktfiler (PDF, XLSX, CSV) til profilens produktinfo.
+
+PDF-sider udtrækkes parallelt i en procespulje med løbende fremdrift. Tabeller
+gemmes kompakt som én linje pr. produkt med kun de valgte kolonner. Resultatet
+caches på disk efter filens hash, så samme fil ikke udtrækkes igen.
+"""
+import hashlib
+import io
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+import PyPDF2
+
+from storage import data_path
+
+PAGES_PER_TASK = 20
+PDF_WORKERS = max(1, min(8, os.cpu_count() or 1))
+
+# Den indlæste PDF i hver worker-proces (sat af _init_worker)
+_reader = None
+
+# Kolonnenavne der typisk beskriver et produkt (matches som delstreng, små bogstaver)
+PRODUCT_COLUMN_HINTS = (
+    "navn", "name", "title", "titel", "produkt", "product", "beskriv", "descr", "materiale",
+    "material", "farve", "color", "colour", "mål", "størrelse", "size", "dimension", "bredde",
+    "højde", "dybde", "længde", "vægt", "weight", "pris", "price", "kategori", "category",
+    "type", "sku", "varenummer", "brand", "serie", "collection",
+)
+
+
+def digest(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def _cache_path(file_digest, variant):
+    key = hashlib.sha256(f"{file_digest}\0{variant}".encode("utf-8")).hexdigest()
+    return data_path(os.path.join("ingest_cache", key + ".txt"))
+
+
+def cached(file_digest, variant, extract):
+    """Returnerer (tekst, fra_cache). `extract()` kaldes kun hvis resultatet ikke er gemt."""
+    path = _cache_path(file_digest, variant)
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read(), True
+    text = extract()
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp, path)
+    return text, False
+
+
+def _init_worker(data):
+    """Indlæser PDF'en én gang pr. worker i stedet for én gang pr. opgave."""
+    global _reader
+    _reader = PyPDF2.PdfReader(io.BytesIO(data))
+
+
+def _extract_pages(start, stop, reader=None):
+    """Tekst for siderne [start, stop); i en worker-proces bruges den indlæste PDF."""
+    reader = reader or _reader
+    return start, [(reader.pages[i].extract_text() or "") for i in range(start, stop)]
+
+
+def pdf_page_count(data):
+    return len(PyPDF2.PdfReader(io.BytesIO(data)).pages)
+
+
+def extract_pdf(data, workers=PDF_WORKERS, on_progress=None):
+    """Udtrækker alle sider parallelt. `on_progress(færdige_sider, sider_i_alt)` kaldes løbende."""
+    total = pdf_page_count(data)
+    pages = [""] * total
+    ranges = [(start, min(start + PAGES_PER_TASK, total)) for start in range(0, total, PAGES_PER_TASK)]
+    done = 0
+    if len(ranges) <= 1:
+        # Små filer: ikke værd at starte en procespulje
+        reader = PyPDF2.PdfReader(io.BytesIO(data))
+        for start, stop in ranges:
+            _, texts = _extract_pages(start, stop, reader)
+            pages[start:stop] = texts
+            done += len(texts)
+            if on_progress:
+                on_progress(done, total)
+    else:
+        # spawn frem for fork: serveren har tråde kørende, og en fork kan arve deres låse
+        with ProcessPoolExecutor(
+            max_workers=min(workers, len(ranges)), mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker, initargs=(data,)
+        ) as pool:
+            futures = [pool.submit(_extract_pages, start, stop) for start, stop in ranges]
+            for future in as_completed(futures):
+                start, texts = future.result()
+                pages[start:start + len(texts)] = texts
+                done += len(texts)
+                if on_progress:
+                    on_progress(done, total)
+    return "\n".join(page.strip() for page in pages if page.strip())
+
+
+def read_table(data, filename):
+    if filename.lower().endswith(".xlsx"):
+        return pd.read_excel(io.BytesIO(data))
+    return pd.read_csv(io.BytesIO(data))
+
+
+def suggest_columns(df):
+    """Kolonner der ligner produktdata; ellers alle tekstkolonner."""
+    hinted = [c for c in df.columns if any(h in str(c).lower() for h in PRODUCT_COLUMN_HINTS)]
+    if hinted:
+        return hinted
+    text_columns = [
+        c for c in df.columns
+        if pd.api.types.is_string_dtype(df[c]) or pd.api.types.is_object_dtype(df[c])
+    ]
+    return text_columns or list(df.columns)
+
+
+def compact_table(df, columns):
+    """Én linje pr. produkt: 'kolonne: værdi; …' uden tomme felter og uden dubletter."""
+    lines = []
+    seen = set()
+    for row in df[list(columns)].itertuples(index=False):
+        fields = []
+        for column, value in zip(columns, row):
+            if pd.isna(value):
+                continue
+            value = " ".join(str(value).split())
+            if value:
+                fields.append(f"{column}: {value}")
+        line = "; ".join(fields)
+        if line and line not in seen:
+            seen.add(line)
+            lines.append(line)
+    return "\n".join(lines)
@@ -0,0 +1,51 @@
+"""Opdeling af HTML i tekstsegmenter, så kun selve teksten sendes til oversættelse.
+
+Markup (tags, attributter, kommentarer, <script>/<style>) bevares byte for byte;
+kun tekstnoderne mellem tags erstattes.
+"""
+import re
+
+# Markup der aldrig skal oversættes. Script/style tages som hele blokke.
+MARKUP_RE = re.compile(
+    r"(<!--.*?-->|<script\b.*?</script\s*>|<style\b.*?</style\s*>|<[^>]*>)",
+    re.DOTALL | re.IGNORECASE
+)
+TAG_RE = re.compile(r"<[a-zA-Z/!][^>]*>")
+LIQUID_RE = re.compile(r"\{\{.*?\}\}|\{%.*?%\}", re.DOTALL)
+ENTITY_RE = re.compile(r"&[#a-zA-Z0-9]+;")
+LETTER_RE = re.compile(r"[^\W\d_]")
+
+
+def looks_like_html(text):
+    return isinstance(text, str) and TAG_RE.search(text) is not None
+
+
+def is_translatable(text):
+    """Segmentet indeholder bogstaver, der ikke kun er Liquid-tags eller HTML-entities."""
+    stripped = ENTITY_RE.sub("", LIQUID_RE.sub("", text))
+    return LETTER_RE.search(stripped) is not None
+
+
+def split_segments(html):
+    """Returnerer (dele, indeks) hvor `dele` er tekst og markup på skift og
+    `indeks` peger på de tekstdele der skal oversættes."""
+    parts = MARKUP_RE.split(html)
+    # re.split med en gruppe giver tekst på lige og markup på ulige pladser
+    indices = [i for i in range(0, len(parts), 2) if is_translatable(parts[i])]
+    return parts, indices
+
+
+def segment_texts(parts, indices):
+    """Den trimmede tekst for hvert segment (whitespace omkring bevares ved samling)."""
+    return [parts[i].strip() for i in indices]
+
+
+def join_segments(parts, indices, translations):
+    """Sætter oversættelserne ind på segmenternes pladser og returnerer den samlede HTML."""
+    out = list(parts)
+    for i, translated in zip(indices, translations):
+        original = parts[i]
+        leading = original[:len(original) - len(original.lstrip())]
+        trailing = original[len(original.rstrip()):]
+        out[i] = leading + translated + trailing
+    return "".join(out)
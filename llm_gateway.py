@@ -0,0 +1,279 @@
+"""Fælles indgang til OpenAI for alle sessioner i processen (SEO-app og CSV-oversætter).
+
+- Identiske kald med samme API-nøgle der er i gang samtidig, slås sammen
+  (single-flight): kun ét kald sendes, og alle ventende får samme svar.
+- Nylige svar gemmes i en begrænset LRU-cache i hukommelsen.
+- Alle kald med samme API-nøgle deler én grænse for samtidighed samt
+  requests og tokens pr. minut.
+- Pladserne fordeles retfærdigt mellem sessioner: en session med mange kald i
+  gang må vente på sessioner med færre, og kan begrænses til et fast antal.
+
+Indstillinger via miljøvariabler (LLM_GATEWAY_CONCURRENCY, _RPM, _TPM,
+_PER_SESSION, _CACHE_SIZE) eller configure(); grænser for én bestemt nøgle
+sættes med set_limits().
+"""
+import contextlib
+import contextvars
+import hashlib
+import json
+import os
+import threading
+from collections import Counter, OrderedDict
+from concurrent.futures import Future
+
+import openai
+
+from llm_metrics import chat_completion, stream_completion
+from rate_limit import RateLimiter, estimate_tokens
+
+_session = contextvars.ContextVar("llm_gateway_session", default=None)
+
+
+def _env_int(name, default):
+    try:
+        return int(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+def set_session(session_id):
+    """Knytter kald i den aktuelle tråd/kontekst til `session_id` (fx én pr. Streamlit-session)."""
+    _session.set(session_id)
+
+
+@contextlib.contextmanager
+def use_session(session_id):
+    """Kald i denne kontekst (og tråde startet med run_in_context) tilhører `session_id`."""
+    token = _session.set(session_id)
+    try:
+        yield
+    finally:
+        _session.reset(token)
+
+
+def key_hash(api_key=None):
+    """Hash af API-nøglen (eller den globale openai.api_key), så selve nøglen ikke gemmes."""
+    return hashlib.sha256(str(api_key or openai.api_key).encode("utf-8")).hexdigest()
+
+
+def request_key(kwargs):
+    """Hash af alt der påvirker svaret (model, beskeder, parametre) og af API-nøglen.
+
+    Nøglen indgår, så svar og fejl kun deles mellem kald med samme nøgle: en
+    ugyldig nøgle kan hverken låne et betalt svar eller give sin fejl videre.
+    """
+    payload = {k: v for k, v in kwargs.items() if k not in ("api_key", "stream")}
+    payload["api_key"] = key_hash(kwargs.get("api_key"))
+    data = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+def estimate_request_tokens(kwargs):
+    prompt = sum(estimate_tokens(m.get("content", "")) for m in kwargs.get("messages", []))
+    return prompt + (kwargs.get("max_tokens") or prompt)
+
+
+class _Budget:
+    """Samtidighed og rate limit for én API-nøgle, med retfærdig fordeling mellem sessioner."""
+
+    def __init__(self, concurrency, rpm, tpm, per_session):
+        self.concurrency = max(1, int(concurrency))
+        self.per_session = max(0, int(per_session))
+        self.limiter = RateLimiter(rpm=rpm, tpm=tpm)
+        self.cond = threading.Condition()
+        self.active = 0
+        self.running = Counter()
+        self.waiting = Counter()
+
+    def update(self, concurrency, rpm, tpm, per_session):
+        """Nye grænser på det samme budget, så kald der er i gang stadig tæller med."""
+        self.limiter.set_limits(rpm, tpm)
+        with self.cond:
+            self.concurrency = max(1, int(concurrency))
+            self.per_session = max(0, int(per_session))
+            self.cond.notify_all()
+
+    def _can_run(self, session):
+        if self.active >= self.concurrency:
+            return False
+        if self.per_session and self.running[session] >= self.per_session:
+            return False
+        # En session får kun en plads, hvis ingen ventende session har færre kald i gang
+        fewest = min(self.running[s] for s, n in self.waiting.items() if n)
+        return self.running[session] <= fewest
+
+    @contextlib.contextmanager
+    def slot(self, session):
+        with self.cond:
+            self.waiting[session] += 1
+            while not self._can_run(session):
+                self.cond.wait()
+            self.waiting[session] -= 1
+            self.active += 1
+            self.running[session] += 1
+        try:
+            yield
+        finally:
+            with self.cond:
+                self.active -= 1
+                self.running[session] -= 1
+                self.cond.notify_all()
+
+
+class LLMGateway:
+    def __init__(self, concurrency=None, rpm=None, tpm=None, per_session=None, cache_size=None):
+        self.concurrency = concurrency or _env_int("LLM_GATEWAY_CONCURRENCY", 16)
+        self.rpm = rpm or _env_int("LLM_GATEWAY_RPM", 500)
+        self.tpm = tpm or _env_int("LLM_GATEWAY_TPM", 150000)
+        self.per_session = _env_int("LLM_GATEWAY_PER_SESSION", 0) if per_session is None else per_session
+        self.cache_size = _env_int("LLM_GATEWAY_CACHE_SIZE", 256) if cache_size is None else cache_size
+        self.lock = threading.Lock()
+        self.budgets = {}
+        self.key_limits = {}
+        self.inflight = {}
+        self.cache = OrderedDict()
+        self.stats = Counter()
+
+    def configure(self, concurrency=None, rpm=None, tpm=None, per_session=None, cache_size=None):
+        """Ændrer indstillingerne; budgetterne for nøglerne opdateres på stedet."""
+        with self.lock:
+            self.concurrency = concurrency or self.concurrency
+            self.rpm = rpm or self.rpm
+            self.tpm = tpm or self.tpm
+            self.per_session = self.per_session if per_session is None else per_session
+            self.cache_size = self.cache_size if cache_size is None else cache_size
+            for key, budget in self.budgets.items():
+                budget.update(per_session=self.per_session, **self._key_limits(key))
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+
+    def set_limits(self, api_key=None, concurrency=None, rpm=None, tpm=None):
+        """Grænser for én API-nøgle (fx kontoens RPM/TPM fra UI'et).
+
+        De gælder for alle sessioner og jobs der bruger nøglen, indtil de ændres igen.
+        Et budget i brug opdateres på stedet, så kald der er i gang stadig tæller med.
+        """
+        key = key_hash(api_key)
+        given = {"concurrency": concurrency, "rpm": rpm, "tpm": tpm}
+        with self.lock:
+            current = self.key_limits.get(key, {})
+            limits = {**current, **{k: int(v) for k, v in given.items() if v}}
+            if limits != current:
+                self.key_limits[key] = limits
+                if key in self.budgets:
+                    self.budgets[key].update(per_session=self.per_session, **self._key_limits(key))
+
+    def _key_limits(self, key):
+        return {"concurrency": self.concurrency, "rpm": self.rpm, "tpm": self.tpm, **self.key_limits.get(key, {})}
+
+    def limits(self, api_key=None):
+        """De grænser der gælder for nøglen lige nu."""
+        with self.lock:
+            return self._key_limits(key_hash(api_key))
+
+    def _budget(self, api_key):
+        key = key_hash(api_key)
+        with self.lock:
+            if key not in self.budgets:
+                self.budgets[key] = _Budget(per_session=self.per_session, **self._key_limits(key))
+            return self.budgets[key]
+
+    def _call(self, call, stage, before_attempt, kwargs):
+        budget = self._budget(kwargs.get("api_key"))
+        estimated = estimate_request_tokens(kwargs)
+
+        def attempt():
+            budget.limiter.acquire(estimated)
+            if before_attempt:
+                before_attempt()
+
+        with budget.slot(_session.get()):
+            result = call(stage, before_attempt=attempt, **kwargs)
+        if isinstance(result, str):
+            actual = estimate_request_tokens({**kwargs, "max_tokens": estimate_tokens(result)})
+        else:
+            actual = (result.get("usage") or {}).get("total_tokens", 0)
+        budget.limiter.settle(estimated, actual)
+        with self.lock:
+            self.stats["calls"] += 1
+        return result
+
+    def complete(self, stage, before_attempt=None, dedupe=True, **kwargs):
+        """Som llm_metrics.chat_completion, men gennem den fælles grænse.
+
+        Med `dedupe` (standard) deles svar mellem identiske kald; slå det fra
+        for kald der skal give forskellige svar på samme prompt. Et svar der
+        allerede ligger i cachen, erstattes da af det nye, så et kasseret svar
+        ikke genbruges senere.
+        """
+        if not dedupe:
+            response = self._call(chat_completion, stage, before_attempt, kwargs)
+            key = request_key(kwargs)
+            with self.lock:
+                if key in self.cache:
+                    self.cache[key] = response
+            return response
+
+        key = request_key(kwargs)
+        with self.lock:
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                self.stats["cache_hits"] += 1
+                return self.cache[key]
+            future = self.inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self.inflight[key] = Future()
+            else:
+                self.stats["coalesced"] += 1
+        if not leader:
+            return future.result()
+
+        try:
+            response = self._call(chat_completion, stage, before_attempt, kwargs)
+        except BaseException as e:
+            with self.lock:
+                self.inflight.pop(key, None)
+            future.set_exception(e)
+            raise
+        with self.lock:
+            self.inflight.pop(key, None)
+            if self.cache_size:
+                self.cache[key] = response
+                while len(self.cache) > self.cache_size:
+                    self.cache.popitem(last=False)
+        future.set_result(response)
+        return response
+
+    def stream(self, stage, on_text=None, before_attempt=None, **kwargs):
+        """Som llm_metrics.stream_completion gennem den fælles grænse (streams deles ikke)."""
+        return self._call(
+            lambda s, **kw: stream_completion(s, on_text=on_text, **kw), stage, before_attempt, kwargs
+        )
+
+    def snapshot(self):
+        with self.lock:
+            return {**self.stats, "cached": len(self.cache), "inflight": len(self.inflight)}
+
+
+gateway = LLMGateway()
+
+
+def complete(stage, **kwargs):
+    return gateway.complete(stage, **kwargs)
+
+
+def stream(stage, on_text=None, **kwargs):
+    return gateway.stream(stage, on_text=on_text, **kwargs)
+
+
+def configure(**options):
+    gateway.configure(**options)
+
+
+def set_limits(api_key=None, **limits):
+    gateway.set_limits(api_key, **limits)
+
+
+def limits(api_key=None):
+    return gateway.limits(api_key)
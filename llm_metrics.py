@@ -0,0 +1,214 @@
+"""Instrumentering af LLM-kald: latens, tokens, retries og estimeret pris pr. stage.
+
+Alle ChatCompletion-kald går gennem chat_completion(stage, ...) eller
+stream_completion(stage, ...). Kaldene registreres i den aktive kørsel (se
+traced_run) og skrives som JSON-linjer til en trace-fil på disk.
+"""
+import contextlib
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+
+import openai
+
+from rate_limit import call_with_backoff, estimate_tokens
+from storage import data_path
+
+# USD pr. 1.000 tokens (input, output)
+PRICES = {"gpt-4-turbo": (0.01, 0.03)}
+DEFAULT_MODEL = "gpt-4-turbo"
+
+# Tom værdi slår trace-filen fra
+TRACE_FILE = os.environ.get("LLM_TRACE_FILE", "llm_trace.jsonl")
+
+_current_run = contextvars.ContextVar("llm_run", default=None)
+_trace_lock = threading.Lock()
+
+
+def estimate_cost(model, prompt_tokens, completion_tokens):
+    price_in, price_out = PRICES.get(model, PRICES[DEFAULT_MODEL])
+    return prompt_tokens / 1000 * price_in + completion_tokens / 1000 * price_out
+
+
+class LLMRun:
+    """Samler kald for én kørsel (fx én oversættelse eller én SEO-batch)."""
+
+    def __init__(self, name):
+        self.name = name
+        self.id = uuid.uuid4().hex[:12]
+        self.started = time.monotonic()
+        self.records = []
+        self.lock = threading.Lock()
+
+    def add(self, record):
+        with self.lock:
+            self.records.append(record)
+
+    def summary(self):
+        """Én række pr. stage plus en total-række."""
+        with self.lock:
+            records = list(self.records)
+        stages = {}
+        for r in records:
+            stages.setdefault(r["stage"], []).append(r)
+        rows = [_summarize(stage, items) for stage, items in stages.items()]
+        if records:
+            total = _summarize("I alt", records)
+            total["wall_seconds"] = round(time.monotonic() - self.started, 2)
+            rows.append(total)
+        return rows
+
+
+def _summarize(stage, items):
+    latencies = sorted(r["latency"] for r in items)
+    ttfts = [r["ttft"] for r in items if r.get("ttft") is not None]
+    p95 = latencies[min(len(latencies) - 1, int(round(0.95 * (len(latencies) - 1))))]
+    return {
+        "stage": stage,
+        "calls": len(items),
+        "errors": sum(1 for r in items if r["error"]),
+        "retries": sum(r["retries"] for r in items),
+        "latency_total": round(sum(latencies), 2),
+        "latency_avg": round(sum(latencies) / len(latencies), 2),
+        "latency_p95": round(p95, 2),
+        "prompt_tokens": sum(r["prompt_tokens"] for r in items),
+        "completion_tokens": sum(r["completion_tokens"] for r in items),
+        "cost_usd": round(sum(r["cost"] for r in items), 4),
+        # Tid til første token findes kun for streamede kald
+        "ttft_avg": round(sum(ttfts) / len(ttfts), 2) if ttfts else None,
+    }
+
+
+@contextlib.contextmanager
+def traced_run(name):
+    """Gør en ny LLMRun aktiv for kald i denne kontekst (og tråde startet med run_in_context)."""
+    run = LLMRun(name)
+    token = _current_run.set(run)
+    try:
+        yield run
+    finally:
+        _current_run.reset(token)
+
+
+def current_run():
+    return _current_run.get()
+
+
+def run_in_context(fn):
+    """Binder den aktuelle kontekst (og dermed kørslen) til `fn`, så den kan køre i en anden tråd."""
+    ctx = contextvars.copy_context()
+    return lambda *args, **kwargs: ctx.run(fn, *args, **kwargs)
+
+
+def _write_trace(record):
+    if not TRACE_FILE:
+        return
+    line = json.dumps(record, ensure_ascii=False) + "\n"
+    with _trace_lock:
+        with open(data_path(TRACE_FILE), "a", encoding="utf-8") as f:
+            f.write(line)
+
+
+def _record(stage, model, started, prompt_tokens, completion_tokens, retries, error, **extra):
+    run = _current_run.get()
+    record = {
+        "ts": time.time(),
+        "run": run.id if run else None,
+        "run_name": run.name if run else None,
+        "stage": stage,
+        "model": model,
+        "latency": round(time.monotonic() - started, 3),
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "retries": retries,
+        "cost": estimate_cost(model, prompt_tokens, completion_tokens),
+        "error": error,
+        **extra,
+    }
+    if run:
+        run.add(record)
+    _write_trace(record)
+
+
+def chat_completion(stage, before_attempt=None, max_retries=6, **kwargs):
+    """openai.ChatCompletion.create med backoff og registrering af latens, tokens, retries og pris.
+
+    `before_attempt` kaldes før hvert forsøg (fx en rate limiter).
+    """
+    retries = 0
+
+    def attempt():
+        if before_attempt:
+            before_attempt()
+        return openai.ChatCompletion.create(**kwargs)
+
+    def on_retry(n, exc, delay):
+        nonlocal retries
+        retries = n
+
+    started = time.monotonic()
+    response = None
+    error = None
+    try:
+        response = call_with_backoff(attempt, max_retries=max_retries, on_retry=on_retry)
+        return response
+    except Exception as e:
+        error = repr(e)
+        raise
+    finally:
+        usage = (response.get("usage") if response is not None and not kwargs.get("stream") else None) or {}
+        _record(
+            stage, kwargs.get("model", DEFAULT_MODEL), started,
+            usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0), retries, error
+        )
+
+
+def stream_completion(stage, on_text=None, before_attempt=None, max_retries=6, **kwargs):
+    """Som chat_completion, men med stream=True. Returnerer hele teksten.
+
+    `on_text(tekst_indtil_nu)` kaldes for hvert modtaget stykke. Bliver kaldet
+    prøvet igen, starter teksten forfra. Streams har ingen usage, så tokens
+    estimeres ud fra teksten, og tiden til første token gemmes som "ttft".
+    """
+    retries = 0
+    first_token = None
+
+    def attempt():
+        nonlocal first_token
+        if before_attempt:
+            before_attempt()
+        pieces = []
+        for chunk in openai.ChatCompletion.create(stream=True, **kwargs):
+            delta = chunk["choices"][0].get("delta", {}).get("content")
+            if not delta:
+                continue
+            if first_token is None:
+                first_token = time.monotonic()
+            pieces.append(delta)
+            if on_text:
+                on_text("".join(pieces))
+        return "".join(pieces)
+
+    def on_retry(n, exc, delay):
+        nonlocal retries
+        retries = n
+
+    started = time.monotonic()
+    text = ""
+    error = None
+    try:
+        text = call_with_backoff(attempt, max_retries=max_retries, on_retry=on_retry)
+        return text
+    except Exception as e:
+        error = repr(e)
+        raise
+    finally:
+        prompt_tokens = sum(estimate_tokens(m.get("content", "")) for m in kwargs.get("messages", []))
+        _record(
+            stage, kwargs.get("model", DEFAULT_MODEL), started,
+            prompt_tokens, estimate_tokens(text), retries, error,
+            ttft=round(first_token - started, 3) if first_token else None
+        )
@@ -0,0 +1,280 @@
+"""Lokal stand-in for OpenAI's ChatCompletion-endpoint til belastningstest uden API-omkostninger.
+
+Svarene er deterministiske (samme forespørgsel giver samme svar), latens og
+429-fejl kan konfigureres, og serveren tæller requests og tokens.
+
+Start serveren og peg appen på den:
+    python mock_openai_server.py --port 8100 --latency 0.3 --rate-429 0.05
+    OPENAI_API_BASE=http://127.0.0.1:8100/v1 streamlit run shopify_csv_app.py
+
+Statistik: GET /stats, nulstil: POST /reset.
+"""
+import argparse
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from rate_limit import estimate_tokens
+
+FILLER_WORDS = (
+    "kvalitet design komfort hverdagen materialer holdbar detaljer funktion "
+    "naturlige farver håndværk indretning rummet stilren praktisk løsning "
+    "skandinavisk enkel elegant tidløs solid let overflade form"
+).split()
+
+
+class MockState:
+    def __init__(self, latency=0.05, jitter=0.0, tokens_per_second=0.0, rate_429=0.0,
+                 short_ratio=1.0, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.tokens_per_second = tokens_per_second
+        self.rate_429 = rate_429
+        self.short_ratio = short_ratio
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.requests = 0
+            self.rate_limited = 0
+            self.prompt_tokens = 0
+            self.completion_tokens = 0
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "requests": self.requests,
+                "rate_limited": self.rate_limited,
+                "prompt_tokens": self.prompt_tokens,
+                "completion_tokens": self.completion_tokens,
+                "total_tokens": self.prompt_tokens + self.completion_tokens,
+            }
+
+    def should_rate_limit(self):
+        with self.lock:
+            self.requests += 1
+            if self.rate_429 and self.random.random() < self.rate_429:
+                self.rate_limited += 1
+                return True
+            return False
+
+    def account(self, prompt_tokens, completion_tokens):
+        with self.lock:
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+
+    def delay(self, completion_tokens):
+        with self.lock:
+            jitter = self.random.uniform(-self.jitter, self.jitter) if self.jitter else 0.0
+        seconds = max(0.0, self.latency + jitter)
+        if self.tokens_per_second:
+            seconds += completion_tokens / self.tokens_per_second
+        return seconds
+
+
+def fake_article(seed_text, words):
+    """Deterministisk 'artikel' med `words` ord, opdelt i HTML-afsnit."""
+    rnd = random.Random(hashlib.sha256(seed_text.encode("utf-8")).hexdigest())
+    out = []
+    for start in range(0, words, 60):
+        count = min(60, words - start)
+        paragraph = " ".join(rnd.choice(FILLER_WORDS) for _ in range(count))
+        out.append(f"<h2>Afsnit {start // 60 + 1}</h2>\n<p>{paragraph.capitalize()}.</p>")
+    return "\n".join(out)
+
+
+def fake_reply(body, state):
+    """Bygger et deterministisk svar ud fra prompten."""
+    messages = body.get("messages", [])
+    system = next((m["content"] for m in messages if m.get("role") == "system"), "")
+    user = messages[-1]["content"] if messages else ""
+    wants_json = (body.get("response_format") or {}).get("type") == "json_object"
+
+    fanout = re.search(r"følgende sprog: (.+?)\. ", system)
+    if wants_json and fanout:
+        languages = [name.strip() for name in fanout.group(1).split(",")]
+        return json.dumps({name: f"[{name}] {user}" for name in languages}, ensure_ascii=False)
+
+    if wants_json:
+        try:
+            payload = json.loads(user)
+        except ValueError:
+            payload = None
+        forbidden = re.search(r"Forbudte ord: \[(.*?)\]", system)
+        if isinstance(payload, dict) and forbidden:
+            # Blacklist-omskrivning: fjern ordene (inkl. endelser) fra hver sætning
+            words = re.findall(r"'([^']+)'", forbidden.group(1))
+            pattern = r"\b(?:" + "|".join(re.escape(w) for w in words) + r")\w*"
+            return json.dumps(
+                {k: re.sub(pattern, "", str(v), flags=re.IGNORECASE) for k, v in payload.items()},
+                ensure_ascii=False
+            )
+        outline = re.search(r"disposition med (\d+) afsnit .*?mindst (\d+) ord", system)
+        if outline:
+            # Disposition: n afsnit med lige store ordbudgetter
+            sections, words = int(outline.group(1)), int(outline.group(2))
+            return json.dumps({
+                "titel": "Artikel",
+                "afsnit": [
+                    {"overskrift": f"Afsnit {n + 1}", "punkter": [], "ord": words // sections}
+                    for n in range(sections)
+                ],
+            }, ensure_ascii=False)
+        if isinstance(payload, dict):
+            language = re.search(r"til (\w+)\.", system)
+            prefix = f"[{language.group(1)}] " if language else ""
+            return json.dumps({k: prefix + str(v) for k, v in payload.items()}, ensure_ascii=False)
+        return json.dumps({"text": user[:200]}, ensure_ascii=False)
+
+    if system:
+        # Oversættelse: returnér input markeret med målsproget
+        language = re.search(r"til (\w+)\.", system)
+        return (f"[{language.group(1)}] " if language else "") + user
+
+    target = re.search(r"mindst (\d+)", user)
+    if user.startswith("Din tekst er") and "\n\n" in user:
+        # Udvidelse af et eksisterende udkast
+        draft = user.split("\n\n", 1)[1]
+        missing = max(0, int(target.group(1)) - len(re.sub(r"<[^>]+>", " ", draft).split())) if target else 0
+        return draft + "\n" + fake_article(user, missing)
+    if user.startswith("Skriv") and target:
+        words = int(int(target.group(1)) * state.short_ratio)
+        return fake_article(user, max(words, 1))
+    if "\n\n" in user:
+        # Omskrivning (humanize, SEO, berigelse m.m.): returnér teksten efter instruktionen
+        return user.split("\n\n", 1)[1]
+    return fake_article(user, 120)
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    server_version = "MockOpenAI/1.0"
+
+    def log_message(self, *args):
+        pass
+
+    def _send_json(self, status, payload, headers=None):
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/stats"):
+            self._send_json(200, self.server.state.snapshot())
+        else:
+            self._send_json(404, {"error": {"message": "Not found", "type": "invalid_request_error"}})
+
+    def do_POST(self):
+        state = self.server.state
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+
+        if self.path.rstrip("/").endswith("/reset"):
+            state.reset()
+            self._send_json(200, {"ok": True})
+            return
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": "Not found", "type": "invalid_request_error"}})
+            return
+        if state.should_rate_limit():
+            self._send_json(
+                429,
+                {"error": {"message": "Rate limit reached (mock)", "type": "rate_limit_error", "code": "rate_limit_exceeded"}},
+                headers={"retry-after": "0.1"}
+            )
+            return
+
+        content = fake_reply(body, state)
+        prompt_tokens = sum(estimate_tokens(m.get("content", "")) for m in body.get("messages", []))
+        completion_tokens = estimate_tokens(content)
+        state.account(prompt_tokens, completion_tokens)
+        delay = state.delay(completion_tokens)
+        model = body.get("model", "gpt-4-turbo")
+
+        if body.get("stream"):
+            self._stream(content, model, delay)
+            return
+
+        time.sleep(delay)
+        self._send_json(200, {
+            "id": "chatcmpl-mock",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        })
+
+    def _stream(self, content, model, delay):
+        """Server-sent events i samme format som OpenAI's stream=True."""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        pieces = re.findall(r"\S+\s*", content) or [content]
+        step = delay / len(pieces)
+        for piece in pieces:
+            time.sleep(step)
+            chunk = {
+                "id": "chatcmpl-mock",
+                "object": "chat.completion.chunk",
+                "model": model,
+                "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}],
+            }
+            self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+
+def make_server(port=0, **options):
+    server = ThreadingHTTPServer(("127.0.0.1", port), MockHandler)
+    server.daemon_threads = True
+    server.state = MockState(**options)
+    return server
+
+
+def start_server(port=0, **options):
+    """Starter serveren i en baggrundstråd og returnerer (server, api_base)."""
+    server = make_server(port, **options)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Lokal mock af OpenAI ChatCompletion.")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--latency", type=float, default=0.2, help="Fast latens pr. kald i sekunder")
+    parser.add_argument("--jitter", type=float, default=0.05, help="Tilfældig variation i latens (±sekunder)")
+    parser.add_argument("--tokens-per-second", type=float, default=0.0, help="Simuleret output-hastighed (0 = ingen)")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="Andel af kald der afvises med 429")
+    parser.add_argument("--short-ratio", type=float, default=1.0, help="Længde af første udkast ift. ønsket antal ord")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    server = make_server(
+        args.port, latency=args.latency, jitter=args.jitter, tokens_per_second=args.tokens_per_second,
+        rate_429=args.rate_429, short_ratio=args.short_ratio, seed=args.seed
+    )
+    print(f"Mock OpenAI kører på http://127.0.0.1:{args.port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""Berigelse af produkttekster pr. produkt med en lokal cache.
+
+Cachen er indholdsadresseret: nøglen er en hash af den rå produkttekst (plus
+model og prompt), så ved en ny synkronisering sendes kun nye eller ændrede
+produkter til modellen.
+"""
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import llm_gateway
+from llm_metrics import run_in_context
+from storage import data_path, get_many
+
+ENRICH_FILE = "enrichment_cache.sqlite"
+MODEL = "gpt-4-turbo"
+MAX_PRODUCT_CHARS = 15000
+WORKERS = 4
+
+ENRICH_INSTRUCTIONS = (
+    "Du får her en rå produkttekst. Strukturer og berig den let (tilføj evt. manglende data). "
+    "Undgå store markdown-overskrifter (###) og 'Produktbeskrivelse for'. "
+    "Undgå at ændre for meget i ordlyden.\n\n"
+)
+
+
+def make_key(raw_text, model=MODEL):
+    """Hash af rå tekst + model + instruktion (ændres prompten, beriges alt igen)."""
+    h = hashlib.sha256()
+    for part in (raw_text, model, ENRICH_INSTRUCTIONS):
+        h.update(str(part).encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+def clean_enriched(text):
+    text = text.strip().replace("Produktbeskrivelse for ", "")
+    return re.sub(r'^###\s+(.*)$', r'\1', text, flags=re.MULTILINE)
+
+
+def enrich_text(raw_text):
+    # Identiske produkter beriget af flere sessioner samtidig deler ét kald
+    r2 = llm_gateway.complete(
+        "berigelse",
+        model=MODEL,
+        messages=[{"role": "user", "content": ENRICH_INSTRUCTIONS + raw_text[:MAX_PRODUCT_CHARS]}],
+        max_tokens=3000
+    )
+    return clean_enriched(r2.choices[0].message.content)
+
+
+class EnrichmentCache:
+    def __init__(self, path=None):
+        self.path = path or data_path(ENRICH_FILE)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS enrichments ("
+            " key TEXT PRIMARY KEY,"
+            " url TEXT,"
+            " enriched TEXT,"
+            " created REAL)"
+        )
+        self.conn.commit()
+
+    def get_many(self, keys):
+        """Returnerer {key: beriget tekst} for de nøgler der findes."""
+        with self.lock:
+            return get_many(self.conn, "enrichments", "enriched", keys)
+
+    def put(self, key, url, enriched):
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO enrichments (key, url, enriched, created) VALUES (?, ?, ?, ?)",
+                (key, url, enriched, time.time())
+            )
+            self.conn.commit()
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+def enrich_products(products, cache, workers=WORKERS):
+    """Beriger [(url, rå tekst)] og giver (url, tekst, fejl, fra_cache) efterhånden som de er klar.
+
+    Produkter i cachen gives først uden kald. Fejler et kald, gives den rå
+    tekst tilbage sammen med fejlen, og intet gemmes.
+    """
+    keys = {url: make_key(raw) for url, raw in products}
+    hits = cache.get_many(set(keys.values()))
+    todo = []
+    for url, raw in products:
+        if keys[url] in hits:
+            yield url, hits[keys[url]], None, True
+        elif not raw.strip():
+            yield url, "", None, False
+        else:
+            todo.append((url, raw))
+    if not todo:
+        return
+
+    with ThreadPoolExecutor(max_workers=max(1, min(int(workers), len(todo)))) as pool:
+        futures = {pool.submit(run_in_context(enrich_text), raw): (url, raw) for url, raw in todo}
+        for future in as_completed(futures):
+            url, raw = futures[future]
+            try:
+                enriched = future.result()
+            except Exception as e:
+                yield url, raw, e, False
+                continue
+            cache.put(keys[url], url, enriched)
+            yield url, enriched, None, False
+
+
+def build_product_info(urls, enriched):
+    """Profilens produktinfo samlet af de berigede produkter i den valgte rækkefølge."""
+    return "".join(
+        f"\n\n=== PRODUKT ===\n{url}\n{enriched[url]}" for url in urls if enriched.get(url)
+    ).strip()
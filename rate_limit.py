@@ -0,0 +1,114 @@
+"""Token-bucket rate limiting og backoff med jitter til OpenAI-kald."""
+import random
+import threading
+import time
+
+import openai
+
+# Fejl der giver mening at prøve igen (429, 5xx, netværk/timeouts)
+RETRYABLE_ERRORS = (
+    openai.error.RateLimitError,
+    openai.error.ServiceUnavailableError,
+    openai.error.APIConnectionError,
+    openai.error.Timeout,
+    openai.error.TryAgain,
+)
+
+
+def estimate_tokens(text):
+    """Groft offline-estimat: ca. 4 tegn pr. token."""
+    if not text:
+        return 0
+    return max(1, len(str(text)) // 4)
+
+
+class TokenBucket:
+    """Bucket med plads til `per_minute` enheder, som fyldes jævnt op over et minut."""
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount):
+        """Reserverer `amount` og returnerer antal sekunder kalderen skal vente."""
+        with self.lock:
+            self._refill()
+            self.tokens -= min(float(amount), self.capacity)
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+    def set_rate(self, per_minute):
+        """Ændrer grænsen uden at fylde bucket'en op, så en ændring ikke giver et udbrud."""
+        with self.lock:
+            self._refill()
+            self.capacity = float(per_minute)
+            self.rate = self.capacity / 60.0
+            self.tokens = min(self.tokens, self.capacity)
+
+    def adjust(self, delta):
+        """Korrigerer et tidligere estimat (positiv delta = brugte mere end reserveret)."""
+        with self.lock:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens - delta)
+
+
+class RateLimiter:
+    """Kombineret grænse for requests pr. minut og tokens pr. minut."""
+
+    def __init__(self, rpm=500, tpm=150000):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+
+    def acquire(self, tokens):
+        wait = max(self.requests.reserve(1), self.tokens.reserve(tokens))
+        if wait > 0:
+            time.sleep(wait)
+
+    def set_limits(self, rpm, tpm):
+        self.requests.set_rate(rpm)
+        self.tokens.set_rate(tpm)
+
+    def settle(self, estimated, actual):
+        if actual:
+            self.tokens.adjust(actual - estimated)
+
+
+def is_retryable(exc):
+    if isinstance(exc, RETRYABLE_ERRORS):
+        return True
+    status = getattr(exc, "http_status", None)
+    return status is not None and (status == 429 or status >= 500)
+
+
+def retry_after(exc):
+    headers = getattr(exc, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after", 0))
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def call_with_backoff(fn, max_retries=6, base_delay=1.0, max_delay=60.0, on_retry=None):
+    """Kalder `fn()` og prøver igen med eksponentiel backoff og fuld jitter ved 429/5xx."""
+    attempt = 0
+    while True:
+        try:
+            return fn()
+        except Exception as e:
+            if attempt >= max_retries or not is_retryable(e):
+                raise
+            delay = random.uniform(0, min(max_delay, base_delay * (2 ** attempt)))
+            delay = max(delay, retry_after(e))
+            attempt += 1
+            if on_retry:
+                on_retry(attempt, e, delay)
+            time.sleep(delay)
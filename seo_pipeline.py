@@ -0,0 +1,343 @@
+"""SEO-artiklens LLM-pipeline: udkast → humanisering → SEO-forbedring → blacklist.
+
+Funktionerne bruges af SEOapp.py og kan importeres uden Streamlit (fx til benchmarks).
+Alle kald går gennem llm_gateway, så samtidige artikler (og sessioner) deler
+samme grænse for samtidighed og rate limit.
+
+I "samlet" tilstand (fused=True) skrives en naturlig, SEO-optimeret artikel i
+ét kald i stedet for tre runder hvor hele artiklen sendes frem og tilbage.
+
+Med disposition (outline=True) laves først en disposition med et ordbudget
+pr. afsnit, hvorefter afsnittene skrives parallelt og samles. Længden styres
+af budgettet, så antallet af kald er kendt på forhånd (1 + antal afsnit, plus
+højst én udvidelse af hvert for kort afsnit) i stedet for at hele udkastet
+sendes retur til udvidelse.
+"""
+import json
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from blacklist import compile_blacklist, replace_sentences, sentences_with_hits
+import llm_gateway
+from llm_metrics import run_in_context
+from translation_engine import parse_batch_response
+
+MODEL = "gpt-4-turbo"
+ARTICLE_WORKERS = 4
+SECTION_WORKERS = 4
+SECTION_WORDS = 250
+MIN_SECTIONS = 3
+MAX_SECTIONS = 8
+# Afsnit bliver ofte lidt kortere end budgettet, så der planlægges med margin
+OUTLINE_MARGIN = 1.15
+
+def _complete(stage, prompt, max_tokens, on_text=None, system=None, **kwargs):
+    """Ét kald gennem den fælles gateway. Returnerer den trimmede tekst.
+
+    Med `on_text` streames svaret, og on_text(tekst_indtil_nu) kaldes løbende.
+    Artikler skal være forskellige selv med samme prompt, så svar deles ikke.
+    """
+    messages = [{"role": "user", "content": prompt}]
+    if system:
+        messages.insert(0, {"role": "system", "content": system})
+    if on_text:
+        return llm_gateway.stream(
+            stage, on_text=on_text, model=MODEL, messages=messages, max_tokens=max_tokens, **kwargs
+        ).strip()
+    response = llm_gateway.complete(
+        stage, dedupe=False, model=MODEL, messages=messages, max_tokens=max_tokens, **kwargs
+    )
+    return response.choices[0].message.content.strip()
+
+def count_words(txt):
+    return len(txt.split())
+
+def generate_iterative_seo_text(base_prompt, min_len=700, max_tries=3, on_text=None):
+    final_text = ""
+    text_draft = _complete("udkast", base_prompt, min_len * 3, on_text)
+    wcount = count_words(text_draft)
+
+    if wcount >= min_len:
+        final_text = text_draft
+    else:
+        final_text = text_draft
+        tries_left = max_tries - 1
+        for i in range(tries_left):
+            ext_prompt = (
+                f"Din tekst er {wcount} ord, men vi ønsker mindst {min_len}. "
+                "Uddyb og tilføj ekstra afsnit, eksempler, og detaljer, så teksten bliver sammenhængende og fyldig:\n\n" +
+                final_text
+            )
+            new_text = _complete("udvidelse", ext_prompt, min_len * 3, on_text)
+            w2 = count_words(new_text)
+            if w2 >= min_len:
+                final_text = new_text
+                break
+            else:
+                final_text = new_text
+                wcount = w2
+    return final_text
+
+def section_count(min_len):
+    return max(MIN_SECTIONS, min(MAX_SECTIONS, round(min_len / SECTION_WORDS)))
+
+def build_outline_prompt(sections, min_len):
+    return (
+        f"Lav en disposition med {sections} afsnit til artiklen på i alt mindst {min_len} ord. "
+        "Fordel ordene efter hvor meget hvert afsnit skal dække, og planlæg indledning, "
+        "evt. FAQ og afslutning som egne afsnit, hvis opgaven kræver det. "
+        'Returnér et JSON-objekt: {"titel": "...", "afsnit": '
+        '[{"overskrift": "...", "punkter": ["..."], "ord": 200}]}.'
+    )
+
+def parse_outline(content, min_len, sections):
+    """Dispositionen som (titel, [(overskrift, punkter, ord)]) med budgetter der dækker min_len.
+
+    Kan svaret ikke bruges, laves en neutral disposition, så artiklen stadig
+    skrives med samme antal kald.
+    """
+    try:
+        data = json.loads(content)
+    except ValueError:
+        data = {}
+    if not isinstance(data, dict):
+        data = {}
+    outline = []
+    for item in data.get("afsnit") or []:
+        if not isinstance(item, dict) or not str(item.get("overskrift") or "").strip():
+            continue
+        points = item.get("punkter") or []
+        if not isinstance(points, list):
+            points = [points]
+        try:
+            words = max(0, int(item.get("ord") or 0))
+        except (TypeError, ValueError):
+            words = 0
+        outline.append((str(item["overskrift"]).strip(), [str(p) for p in points if p], words))
+    if not outline:
+        outline = [("Indledning", [], 0)]
+        outline += [(f"Del {n}", [], 0) for n in range(1, sections - 1)]
+        outline += [("Afslutning", [], 0)]
+    outline = outline[:MAX_SECTIONS]
+
+    # Manglende budgetter fordeles ligeligt; summen skaleres op til min_len plus margin
+    target = int(min_len * OUTLINE_MARGIN)
+    even = target // len(outline)
+    outline = [(h, p, w or even) for h, p, w in outline]
+    total = sum(w for _, _, w in outline)
+    factor = max(1.0, target / total)
+    outline = [(h, p, max(50, round(w * factor))) for h, p, w in outline]
+    return str(data.get("titel") or "").strip(), outline
+
+def build_section_prompt(base_prompt, title, outline, index):
+    heading, points, words = outline[index]
+    plan = "\n".join(
+        f"{n}. {h}" + (" (dette afsnit)" if n - 1 == index else "") for n, (h, _, _) in enumerate(outline, 1)
+    )
+    return (
+        f"Skriv afsnittet '{heading}' på mindst {words} ord til artiklen"
+        + (f" '{title}'" if title else "") + ". "
+        + (f"Afsnittet skal dække: {'; '.join(points)}. " if points else "")
+        + "Skriv kun dette afsnit og gentag ikke indhold fra de andre afsnit i dispositionen. "
+        f"Returnér afsnittet i HTML, begyndende med <h2>{heading}</h2> (brug evt. <h3> herunder).\n\n"
+        f"Artiklens disposition:\n{plan}\n\n"
+        f"Opgaven for hele artiklen:\n{base_prompt}"
+    )
+
+def generate_outlined_text(base_prompt, min_len=700, on_text=None, workers=SECTION_WORKERS):
+    """Disposition først, derefter afsnittene parallelt.
+
+    Bruger 1 + antal afsnit kald; kun afsnit der bliver for korte udvides,
+    højst én gang hver.
+    """
+    sections = section_count(min_len)
+    content = _complete(
+        "disposition", base_prompt, 150 + sections * 80,
+        system=build_outline_prompt(sections, min_len),
+        response_format={"type": "json_object"}
+    )
+    title, outline = parse_outline(content, min_len, sections)
+    parts = [""] * len(outline)
+
+    def write(index):
+        def on_section_text(text):
+            parts[index] = text
+            on_text("\n".join(p for p in parts if p))
+        words = outline[index][2]
+        parts[index] = _complete(
+            "afsnit", build_section_prompt(base_prompt, title, outline, index), words * 3,
+            on_section_text if on_text else None
+        )
+        # Et afsnit under sin andel af min_len udvides én gang – kun afsnittet sendes med
+        wcount = count_words(parts[index])
+        if wcount < words / OUTLINE_MARGIN:
+            parts[index] = _complete(
+                "udvidelse",
+                f"Din tekst er {wcount} ord, men vi ønsker mindst {words}. "
+                "Uddyb afsnittet med flere detaljer og eksempler, og bevar overskriften og HTML'en:\n\n"
+                + parts[index],
+                words * 3, on_section_text if on_text else None
+            )
+
+    with ThreadPoolExecutor(max_workers=max(1, min(int(workers), len(outline)))) as pool:
+        for future in [pool.submit(run_in_context(write), i) for i in range(len(outline))]:
+            future.result()
+    text = "\n".join(parts)
+    if on_text:
+        on_text(text)
+    return text
+
+def build_blacklist_prompt(words):
+    return (
+        "Du får et JSON-objekt, hvor hver værdi er en sætning fra en artikel. "
+        f"Forbudte ord: {words}. Omskriv hver sætning, så ingen af de forbudte ord bruges, "
+        "heller ikke i bøjet eller afledt form. Bevar betydning, tone, længde og eventuel HTML. "
+        "Returnér et JSON-objekt med præcis de samme nøgler."
+    )
+
+def check_blacklist_and_rewrite(text, blacklist_words, max_tries=2, on_text=None):
+    """Omskriver kun de sætninger der indeholder forbudte ord. Uden fund laves intet kald."""
+    matcher = compile_blacklist(blacklist_words)
+    if not matcher:
+        return text
+
+    final_text = text
+    for attempt in range(max_tries):
+        parts, flagged = sentences_with_hits(final_text, matcher)
+        if not flagged:
+            break
+        found = sorted({w for words in flagged.values() for w in words})
+        payload = {str(i): parts[i].strip() for i in flagged}
+        content = _complete(
+            "blacklist",
+            json.dumps(payload, ensure_ascii=False),
+            max(300, sum(len(v.split()) for v in payload.values()) * 4),
+            system=build_blacklist_prompt(found),
+            response_format={"type": "json_object"}
+        )
+        rewritten = parse_batch_response(content, list(payload))
+        if rewritten:
+            final_text = replace_sentences(parts, {int(k): v for k, v in rewritten.items()})
+            if on_text:
+                on_text(final_text)
+    return final_text
+
+# -- NYE FUNKTIONER TIL MULTI-AGENT PROCESSEN --
+
+def generate_initial_draft(prompt, min_len=700, max_tries=3, on_text=None, outline=False):
+    if outline:
+        return generate_outlined_text(prompt, min_len, on_text)
+    return generate_iterative_seo_text(prompt, min_len, max_tries, on_text)
+
+def humanize_text(text, on_text=None):
+    humanize_prompt = (
+        "Forbedr følgende tekst, så den lyder mere naturlig og menneskelig, "
+        "og juster tone og flow uden at ændre på det centrale indhold:\n\n" + text
+    )
+    return _complete("humanisering", humanize_prompt, max(300, len(text.split()) * 4), on_text)
+
+def enhance_seo_text(text, rel_soegeord, extra_instructions, on_text=None):
+    seo_prompt = (
+        "Forbedr SEO-optimeringen af følgende tekst ved at integrere de relaterede søgeord: " + rel_soegeord + ". " +
+        extra_instructions +
+        "Husk at teksten skal forblive en sammenhængende artikel på mindst det angivne antal ord. " +
+        "Her er teksten:\n\n" + text
+    )
+    return _complete("seo-forbedring", seo_prompt, max(300, len(text.split()) * 4), on_text)
+
+def build_base_prompt(seo_key, formaal, malgruppe, tone, brand_profile, produkt_info, min_len, rel_soegeord):
+    return (
+        f"Skriv en komplet, sammenhængende SEO-optimeret artikel på dansk om '{seo_key}' "
+        f"med fokus på {formaal}. Artiklen skal være skrevet for en målgruppe af {malgruppe} "
+        f"og have en {tone.lower()} tone-of-voice. Brug følgende information fra brandprofil og produktinfo: "
+        f"{brand_profile} {produkt_info}. "
+        f"Artiklen skal være på mindst {min_len} ord og dække emnet grundigt. "
+        f"Relaterede søgeord: {rel_soegeord}.\n"
+        "Returnér hele teksten i HTML med passende overskrifter (<h2>, <h3>, <h4>). "
+        "Husk at teksten skal være sammenhængende og fyldig."
+    )
+
+def build_fused_prompt(base_prompt, rel_soegeord, extra_instructions):
+    """Udkast, humanisering og SEO-forbedring samlet i én instruktion."""
+    return (
+        base_prompt + " "
+        "Skriv naturligt og menneskeligt med god tone og flow, så teksten ikke lyder maskinskrevet. "
+        "Integrér de relaterede søgeord naturligt: " + rel_soegeord + ". " +
+        extra_instructions
+    )
+
+def build_extra_instructions(inc_faq, inc_meta, inc_links, inc_cta):
+    extra_instructions = ""
+    if inc_faq:
+        extra_instructions += "Tilføj en FAQ-sektion med mindst 3 spørgsmål. "
+    if inc_meta:
+        extra_instructions += "Tilføj meta-titel (60 tegn) og meta-beskrivelse (160 tegn). "
+    if inc_links:
+        extra_instructions += "Tilføj mindst 2 interne links. "
+    if inc_cta:
+        extra_instructions += "Afslut med en tydelig CTA. "
+    return extra_instructions
+
+def run_article_pipeline(base_prompt, min_len, rel_soegeord, extra_instructions, blacklist,
+                         on_stage=None, on_text=None, fused=False, outline=False):
+    on_stage = on_stage or (lambda stage: None)
+    if fused:
+        # Ét samlet udkast (plus evt. udvidelser), derefter kun blacklist-check
+        on_stage("udkast")
+        draft = generate_initial_draft(
+            build_fused_prompt(base_prompt, rel_soegeord, extra_instructions), min_len=min_len,
+            on_text=on_text, outline=outline
+        )
+        on_stage("blacklist")
+        return check_blacklist_and_rewrite(draft, blacklist, max_tries=2, on_text=on_text)
+    # 1) Generer første udkast af hovedartiklen
+    on_stage("udkast")
+    initial_draft = generate_initial_draft(base_prompt, min_len=min_len, on_text=on_text, outline=outline)
+    # 2) Humaniser teksten
+    on_stage("humanisering")
+    humanized = humanize_text(initial_draft, on_text)
+    # 3) Forfin SEO-elementerne med de ekstra instruktioner, uden at gå på kompromis med længden
+    on_stage("seo-forbedring")
+    enhanced_seo = enhance_seo_text(humanized, rel_soegeord, extra_instructions, on_text)
+    # 4) Kør blacklist-check
+    on_stage("blacklist")
+    return check_blacklist_and_rewrite(enhanced_seo, blacklist, max_tries=2, on_text=on_text)
+
+def generate_articles(count, base_prompt, min_len, rel_soegeord, extra_instructions, blacklist,
+                      workers=ARTICLE_WORKERS, on_poll=None, poll_interval=0.5, stream=False, fused=False,
+                      outline=False):
+    """Kører `count` artikel-pipelines samtidigt og giver (nr, tekst, fejl) efterhånden som de bliver færdige.
+
+    `on_poll(status, texts)` kaldes i den kaldende tråd med {nr: stage} og, når
+    der streames, {nr: tekst_indtil_nu}, så UI'et kan vise fremdrift pr. artikel.
+    """
+    status = {i: "i kø" for i in range(count)}
+    texts = {}
+
+    def run(i):
+        def on_stage(stage):
+            status[i] = stage
+
+        def on_text(text):
+            texts[i] = text
+        return run_article_pipeline(
+            base_prompt, min_len, rel_soegeord, extra_instructions, blacklist,
+            on_stage=on_stage, on_text=on_text if stream else None, fused=fused,
+            outline=outline
+        )
+
+    with ThreadPoolExecutor(max_workers=max(1, min(int(workers), count))) as pool:
+        futures = {pool.submit(run_in_context(run), i): i for i in range(count)}
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, timeout=poll_interval, return_when=FIRST_COMPLETED)
+            for future in done:
+                i = futures[future]
+                try:
+                    text, err = future.result(), None
+                    status[i] = "færdig"
+                except Exception as e:
+                    text, err = None, e
+                    status[i] = "fejl"
+                yield i, text, err
+            if on_poll:
+                on_poll(dict(status), dict(texts))
@@ -1,8 +1,22 @@
 import streamlit as st 
 import pandas as pd
 import openai
-import time
 import io
+import os
+import tempfile
+
+from app_common import show_run_summary, start_gateway_session
+from csv_streaming import read_locales, save_upload
+from shopify_translator import (
+    format_plan, format_stats, plan_dataframe, plan_file, resolve_locales, translate_dataframe, translate_file
+)
+import llm_gateway
+from llm_metrics import traced_run
+from translation_engine import MODEL, SUPPORTED_LANGUAGES
+from translation_jobs import ACTIVE, DONE, RUNNING, JobQueue, JobWorkers, eta_seconds, stop_workers
+from translation_journal import TranslationJournal, file_hash, job_id
+from translation_planner import triage, triage_table
+from translation_validation import report_frame
 
 st.set_page_config(page_title="Shopify CSV Oversætter", layout="wide")
 
@@ -28,66 +42,382 @@ def check_password():
 
 check_password()
 
+start_gateway_session()
+
 st.title("🌐 Shopify CSV Oversætter")
 st.markdown("Upload en CSV-fil fra Shopify, og oversæt indholdet automatisk baseret på Locale-kolonnen.")
 
-supported_languages = {
-    "en": "Engelsk", "de": "Tysk", "fr": "Fransk", "nl": "Hollandsk",
-    "es": "Spansk", "it": "Italiensk", "sv": "Svensk", "no": "Norsk",
-    "fi": "Finsk", "pl": "Polsk", "ja": "Japansk"
-}
+# Arbejdskopien ligger i sessionen; cachen holder kun de seneste uploads (store eksporter fylder)
+@st.cache_data(show_spinner="Indlæser CSV...", max_entries=2)
+def load_frame(upload_hash, _data):
+    """Parser uploaden én gang pr. fil (nøglen er filens hash, ikke selve data)."""
+    frame = pd.read_csv(io.BytesIO(_data))
+    frame.columns = frame.columns.str.strip()
+    frame["Translated content"] = frame["Translated content"].astype(object)
+    return frame
+
+
+@st.cache_data(max_entries=4)
+def row_options(upload_hash, _df):
+    """Rækkerne sorteret efter Field og deres etiketter til vælgeren."""
+    order = _df.sort_values(by="Field").index
+    labels = (
+        _df["Type"].astype(str) + " → " + _df["Field"].astype(str) + " (" + _df["Locale"].astype(str) + ")"
+    )
+    return order.tolist(), labels.to_dict()
+
+
+# "Clear cache" frigiver køen; den gamle pulje stopper efter sine aktuelle jobs, så den nye ikke kommer oveni
+@st.cache_resource(on_release=stop_workers)
+def get_job_queue():
+    """Én kø og én pulje af baggrundsworkers pr. serverproces, uafhængigt af browsersessioner."""
+    queue = JobQueue()
+    JobWorkers(queue).start()
+    return queue
+
+
+def show_gateway_limits(api_key):
+    """Gatewayen er den eneste rate limiter; dens grænser for nøglen deles af alle sessioner og jobs."""
+    if not api_key:
+        return
+    limits = llm_gateway.limits(api_key)
+    st.caption(
+        f"Gældende grænser for nøglen (alle sessioner og baggrundsjob): {limits['concurrency']} samtidige kald, "
+        f"{limits['rpm']} RPM, {limits['tpm']} TPM. RPM og TPM ovenfor gælder for nøglen fra næste oversættelse; "
+        "workers er kun denne kørsels egne samtidige forespørgsler."
+    )
+
+
+def format_eta(seconds):
+    if seconds is None:
+        return "–"
+    minutes, seconds = divmod(int(seconds), 60)
+    return f"{minutes} min {seconds:02d} s" if minutes else f"{seconds} s"
+
+
+@st.fragment(run_every=2)
+def show_jobs(queue):
+    """Joblisten opdateres hvert andet sekund uden at genindlæse resten af siden."""
+    jobs = queue.list_jobs()
+    if not jobs:
+        st.info("Ingen jobs endnu.")
+        return
+    for job in jobs:
+        with st.container(border=True):
+            head, actions = st.columns([4, 1])
+            with head:
+                st.markdown(f"**#{job['id']} {job['name']}** · {', '.join(job['locales'])} · {job['status']}")
+                if job["status"] in ACTIVE:
+                    st.progress(job["progress"] or 0.0)
+                    if job["status"] == RUNNING:
+                        st.caption(f"{job['progress'] * 100:.0f} % · resttid ca. {format_eta(eta_seconds(job))}")
+                    else:
+                        st.caption("Venter på en ledig worker")
+                elif job["status"] == DONE and job["stats"]:
+                    st.caption(format_stats(job["stats"]))
+                elif job["error"]:
+                    st.caption(f"Fejl: {job['error']}")
+            with actions:
+                if job["status"] in ACTIVE:
+                    if st.button("Annullér", key=f"cancel_job_{job['id']}"):
+                        queue.cancel(job["id"])
+                        st.rerun(scope="fragment")
+                else:
+                    if job["status"] == DONE and os.path.exists(job["output_path"]):
+                        st.download_button(
+                            "📂 Download", data=lambda path=job["output_path"]: read_bytes(path),
+                            key=f"download_job_{job['id']}",
+                            file_name=f"{os.path.splitext(job['name'])[0]}_translated.csv", mime="text/csv"
+                        )
+                    if job["report_path"] and os.path.exists(job["report_path"]) and (job["stats"] or {}).get("invalid"):
+                        st.download_button(
+                            "🔎 Kontrolrapport", data=lambda path=job["report_path"]: read_bytes(path),
+                            key=f"report_job_{job['id']}",
+                            file_name=f"{os.path.splitext(job['name'])[0]}_kontrol.csv", mime="text/csv"
+                        )
+                    if st.button("Slet", key=f"delete_job_{job['id']}"):
+                        queue.delete(job["id"])
+                        st.rerun(scope="fragment")
+
+
+def show_job_page(api_key):
+    """Flere CSV'er i kø på én gang; oversættelsen kører videre selvom fanen lukkes."""
+    queue = get_job_queue()
+    uploads = st.file_uploader("Upload en eller flere Shopify CSV-filer", type=["csv"], accept_multiple_files=True)
+    with st.expander("⚙️ Indstillinger for nye jobs"):
+        workers = st.number_input("Samtidige forespørgsler pr. job (workers)", min_value=1, max_value=64, value=8)
+        rpm_limit = st.number_input("Maks. forespørgsler pr. minut (RPM)", min_value=1, value=500, step=50)
+        tpm_limit = st.number_input("Maks. tokens pr. minut (TPM)", min_value=1000, value=150000, step=10000)
+        use_batching = st.checkbox("Saml korte tekster i batches (færre forespørgsler)", value=True)
+        use_html_segments = st.checkbox("HTML-bevidst: send kun tekstnoder til modellen", value=True)
+        use_validation = st.checkbox("Kontrollér oversættelserne og oversæt kun fejlende rækker igen", value=True)
+        show_gateway_limits(api_key)
+    if uploads and api_key:
+        selections = {}
+        for n, upload in enumerate(uploads):
+            upload_id = (upload.name, upload.size)
+            locales_key = f"job_locales_{upload.name}_{upload.size}"
+            if locales_key not in st.session_state:
+                upload.seek(0)
+                st.session_state[locales_key] = [
+                    c for c in read_locales(upload) if c in SUPPORTED_LANGUAGES
+                ]
+            available = st.session_state[locales_key]
+            selections[upload_id] = st.multiselect(
+                f"Locales for {upload.name}", options=available, default=available, key=f"job_select_{n}"
+            )
+        if st.button("➕ Læg i kø"):
+            options = {
+                "workers": workers,
+                "rpm": rpm_limit,
+                "tpm": tpm_limit,
+                "batch_tokens": 2000 if use_batching else 0,
+                "html_segments": use_html_segments,
+                "validate": use_validation,
+            }
+            added = 0
+            for upload in uploads:
+                chosen = selections[(upload.name, upload.size)]
+                if chosen:
+                    queue.submit(upload.name, upload, chosen, api_key, options)
+                    added += 1
+            st.success(f"{added} job(s) lagt i kø.")
+    elif uploads:
+        st.info("Indsæt din OpenAI API-nøgle for at lægge filerne i kø.")
+    st.caption(
+        "🔑 API-nøglen gemmes ukrypteret i jobdatabasen på serveren, indtil jobbet er færdigt, "
+        "annulleret eller fejlet, så jobbet kan køre videre efter en genstart."
+    )
+
+    st.subheader("📦 Jobs")
+    show_jobs(queue)
+
+
+def read_bytes(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def show_validation_report(report):
+    """Rækker der fejlede kontrollen efter oversættelse, og om den nye oversættelse rettede dem."""
+    if not report:
+        return
+    frame = report_frame(report)
+    remaining = int((frame["Efter ny oversættelse"] != "OK").sum())
+    with st.expander(f"🔎 Kontrol: {len(frame)} rækker fejlede, {len(frame) - remaining} rettet automatisk"):
+        st.dataframe(frame, hide_index=True)
+
 
-uploaded_file = st.file_uploader("Upload din Shopify CSV-fil", type=["csv"])
 api_key = st.text_input("Indsæt din OpenAI API-nøgle", type="password")
+app_mode = st.radio(
+    "Tilstand", ["Redigér én fil", "Baggrundsjob (flere filer)"], horizontal=True,
+    help="Baggrundsjob kører på serveren, så fanen kan lukkes; resultatet kan hentes senere."
+)
+if app_mode == "Baggrundsjob (flere filer)":
+    show_job_page(api_key)
+    st.stop()
+
+uploaded_file = st.file_uploader("Upload din Shopify CSV-fil", type=["csv"])
 
 if uploaded_file and api_key:
     openai.api_key = api_key
 
-    df = pd.read_csv(uploaded_file)
-    df.columns = df.columns.str.strip()
+    streaming_mode = st.checkbox("Stor fil: streaming-tilstand (læs i bidder og skriv resultatet til disk)")
+
+    if streaming_mode:
+        # Gem uploaden på disk én gang pr. fil i stedet for at holde en DataFrame i hukommelsen
+        upload_id = (uploaded_file.name, uploaded_file.size)
+        if st.session_state.get("stream_upload_id") != upload_id:
+            st.session_state["stream_upload_id"] = upload_id
+            # Én mappe pr. session, som genbruges ved nye uploads
+            if "stream_folder" not in st.session_state:
+                st.session_state["stream_folder"] = tempfile.mkdtemp(prefix="shopify_csv_")
+            st.session_state["stream_input"] = save_upload(uploaded_file, st.session_state["stream_folder"])
+            st.session_state["stream_locales"] = read_locales(st.session_state["stream_input"])
+            with open(st.session_state["stream_input"], "rb") as f:
+                st.session_state["upload_hash"] = file_hash(f)
+            st.session_state.pop("stream_output", None)
+            st.session_state.pop("stream_report", None)
+            st.session_state.pop("stream_plan", None)
+        available_locales = st.session_state["stream_locales"]
+    else:
+        upload_id = (uploaded_file.name, uploaded_file.size)
+        if st.session_state.get("upload_id") != upload_id:
+            st.session_state["upload_id"] = upload_id
+            st.session_state["upload_hash"] = file_hash(uploaded_file)
+            # Arbejdskopien lever i sessionen, så den ikke parses igen ved hver interaktion
+            st.session_state["df"] = load_frame(st.session_state["upload_hash"], uploaded_file.getvalue())
+            # Den uploadede oversættelseskolonne er reference for hvilke rækker der er ændret
+            st.session_state["baseline"] = st.session_state["df"]["Translated content"].fillna("").astype(str)
+            st.session_state["changed_rows"] = set()
+            st.session_state.pop("journal_applied", None)
+            st.session_state.pop("validation_report", None)
+        df = st.session_state["df"]
+        available_locales = df["Locale"].dropna().unique().tolist()
     st.success("CSV-fil indlæst!")
 
-    available_locales = df["Locale"].dropna().unique().tolist()
+    def refresh_changes():
+        """Genberegner sættet af rækker der afviger fra den uploadede fil."""
+        current = df["Translated content"].fillna("").astype(str)
+        st.session_state["changed_rows"] = set(df.index[current != st.session_state["baseline"]])
+
+    def set_translation(idx, text):
+        df.at[idx, "Translated content"] = text
+        if text == st.session_state["baseline"][idx]:
+            st.session_state["changed_rows"].discard(idx)
+        else:
+            st.session_state["changed_rows"].add(idx)
+
     selected_locales = st.multiselect("Vælg hvilke Locale-sprog du vil oversætte", options=available_locales, default=available_locales)
+    locales = resolve_locales(selected_locales)
+
+    # Journal på disk: færdige rækker overlever genindlæsning, genstart og API-udfald
+    journal_job = job_id(st.session_state["upload_hash"], locales, MODEL)
+    journal = TranslationJournal(journal_job)
+    # I streaming-tilstand tælles kun rækkerne; journalen læses bid for bid under oversættelsen
+    journal_done = {} if streaming_mode else journal.load()
+    journal_rows = journal.count() if streaming_mode else len(journal_done)
+    resume = False
+    if journal_rows:
+        resume = st.checkbox(f"♻️ Genoptag tidligere job ({journal_rows} rækker allerede oversat)", value=True)
+    if not streaming_mode:
+        applied = st.session_state.get("journal_applied")
+        if applied and (applied != journal_job or not resume):
+            # Fravalgt (eller andre sprog): journalens rækker får deres uploadede værdi tilbage,
+            # så "start forfra" også oversætter dem
+            original = load_frame(st.session_state["upload_hash"], uploaded_file.getvalue())
+            rows = [index for index in TranslationJournal(applied).load() if index in df.index]
+            df.loc[rows, "Translated content"] = original.loc[rows, "Translated content"]
+            st.session_state.pop("journal_applied")
+            refresh_changes()
+        if resume and st.session_state.get("journal_applied") != journal_job:
+            journal.apply(df, journal_done)
+            st.session_state["journal_applied"] = journal_job
+            refresh_changes()
+
+    with st.expander("⚙️ Avancerede indstillinger"):
+        workers = st.number_input("Samtidige forespørgsler i denne kørsel (workers)", min_value=1, max_value=64, value=8)
+        rpm_limit = st.number_input("Maks. forespørgsler pr. minut (RPM)", min_value=1, value=500, step=50)
+        tpm_limit = st.number_input("Maks. tokens pr. minut (TPM)", min_value=1000, value=150000, step=10000)
+        use_memory = st.checkbox("Brug oversættelseshukommelse (genbrug tidligere oversættelser)", value=True)
+        use_batching = st.checkbox("Saml korte tekster i batches (færre forespørgsler)", value=True)
+        batch_tokens = st.number_input("Token-budget pr. batch", min_value=200, max_value=8000, value=2000, step=100, disabled=not use_batching)
+        use_fanout = st.checkbox("Oversæt til alle valgte sprog i én forespørgsel pr. tekst (fan-out)", value=False)
+        use_html_segments = st.checkbox("HTML-bevidst: send kun tekstnoder til modellen (markup bevares uændret)", value=True)
+        use_validation = st.checkbox(
+            "Kontrollér oversættelserne (tags, placeholders, længde, fejl) og oversæt kun fejlende rækker igen",
+            value=True
+        )
+        show_gateway_limits(api_key)
+
+    translate_options = {
+        "workers": workers,
+        "rpm": rpm_limit,
+        "tpm": tpm_limit,
+        "use_memory": use_memory,
+        "batch_tokens": batch_tokens if use_batching else 0,
+        "fanout": use_fanout,
+        "html_segments": use_html_segments,
+        "validate": use_validation,
+    }
+
+    # Plan: triage af rækker og estimat af forespørgsler, tokens, tid og pris før noget kaldes
+    st.subheader("📋 Plan før oversættelse")
+    if streaming_mode:
+        plan_key = repr((locales, translate_options))
+        if st.button("Beregn plan"):
+            st.session_state["stream_plan"] = (plan_key, plan_file(st.session_state["stream_input"], locales, **translate_options))
+        stored_plan = st.session_state.get("stream_plan")
+        plan = stored_plan[1] if stored_plan and stored_plan[0] == plan_key else None
+    else:
+        # Planen beregnes kun igen når filen, valgene eller de ændrede rækker ændrer sig –
+        # ikke ved hvert klik i redigeringen nedenfor
+        plan_key = (
+            st.session_state["upload_hash"], repr(locales), repr(translate_options),
+            hash(frozenset(st.session_state["changed_rows"]))
+        )
+        cached_plan = st.session_state.get("plan_cache")
+        if not cached_plan or cached_plan[0] != plan_key:
+            reasons = triage(df, locales)
+            cached_plan = (
+                plan_key, plan_dataframe(df, locales, reasons=reasons, **translate_options),
+                triage_table(df, reasons)
+            )
+            st.session_state["plan_cache"] = cached_plan
+        plan = cached_plan[1]
+    if plan:
+        m1, m2, m3, m4 = st.columns(4)
+        m1.metric("Rækker at oversætte", f"{plan['rows_to_translate']} / {plan['rows']}")
+        m2.metric("Forespørgsler", plan["requests"])
+        m3.metric("Tokens (input + output)", plan["input_tokens"] + plan["output_tokens"])
+        m4.metric("Forventet tid", f"{plan['seconds'] / 60:.1f} min")
+        st.caption(format_plan(plan))
+        if not streaming_mode:
+            with st.expander("Triage pr. Type/Field"):
+                st.dataframe(cached_plan[2])
+
+    if streaming_mode:
+        if st.button("✉️ Start oversættelse"):
+            progress = st.progress(0)
+            input_path = st.session_state["stream_input"]
+            output_path = os.path.join(os.path.dirname(input_path), "output.csv")
+            report_path = os.path.join(os.path.dirname(input_path), "report.csv")
+            with traced_run("oversættelse") as run:
+                stats = translate_file(
+                    input_path, output_path, api_key, locales,
+                    resume=resume, on_progress=progress.progress, report_path=report_path, **translate_options
+                )
+            st.session_state["stream_output"] = output_path
+            st.session_state["stream_report"] = report_path if stats.get("invalid") else None
+            st.info(format_stats(stats))
+            show_run_summary(run)
+            st.success("Oversættelse færdig!")
+
+        if st.session_state.get("stream_output"):
+            output_path = st.session_state["stream_output"]
+            st.download_button(
+                label="📂 Download oversat CSV",
+                data=lambda: read_bytes(output_path),
+                file_name="shopify_translated.csv",
+                mime="text/csv"
+            )
+        if st.session_state.get("stream_report"):
+            report_path = st.session_state["stream_report"]
+            st.download_button(
+                label="🔎 Download kontrolrapport",
+                data=lambda: read_bytes(report_path),
+                file_name="shopify_kontrol.csv",
+                mime="text/csv"
+            )
+        st.info("Redigering og forhåndsvisning er ikke tilgængelig i streaming-tilstand.")
+        st.stop()
 
     if st.button("✉️ Start oversættelse"):
         progress = st.progress(0)
-        total = len(df)
-        count = 0
-
-        for index, row in df.iterrows():
-            locale = row["Locale"]
-            if locale in supported_languages and locale in selected_locales:
-                if pd.isna(row["Translated content"]) or row["Translated content"].strip() == "":
-                    try:
-                        response = openai.ChatCompletion.create(
-                            model="gpt-4-turbo",
-                            messages=[
-                                {"role": "system", "content": f"Du er en professionel oversætter. Oversæt nøjagtigt og ordret fra dansk til {supported_languages[locale]}. Bevar alle HTML-tags og strukturen præcis som den er. Du må ikke forklare noget. Returnér KUN den oversatte tekst."},
-                                {"role": "user", "content": f"{row['Default content']}"}
-                            ]
-                        )
-                        translated_text = response.choices[0].message.content.strip()
-                        df.at[index, "Translated content"] = translated_text
-                        st.session_state[f"backup_translated_{index}"] = translated_text
-                    except Exception as e:
-                        df.at[index, "Translated content"] = f"FEJL: {e}"
-            count += 1
-            progress.progress(count / total)
-            time.sleep(1)
+        if not resume:
+            journal.reset()
 
+        report = []
+        with traced_run("oversættelse") as run:
+            stats = translate_dataframe(
+                df, api_key, locales, journal=journal,
+                on_progress=lambda done, total: progress.progress(done / total),
+                on_result=lambda index, _: st.session_state["changed_rows"].add(index),
+                report=report,
+                **translate_options
+            )
+        st.session_state["validation_report"] = report
+        st.info(format_stats(stats))
+        show_run_summary(run)
         st.success("Oversættelse færdig!")
 
+    show_validation_report(st.session_state.get("validation_report"))
+
     st.markdown("---")
     st.subheader("📝 Rediger og forhåndsvis oversættelser")
 
-    def label_row(i):
-        type_field = df.at[i, 'Type']
-        field_name = df.at[i, 'Field']
-        locale = df.at[i, 'Locale']
-        return f"{type_field} → {field_name} ({locale})"
-
-    selected_row = st.selectbox("Vælg række til redigering og preview", options=df.sort_values(by='Field').index, format_func=label_row)
+    sorted_rows, row_labels = row_options(st.session_state["upload_hash"], df)
+    selected_row = st.selectbox("Vælg række til redigering og preview", options=sorted_rows, format_func=row_labels.get)
 
     st.markdown("**🔍 Forhåndsvisning af indhold:**")
     col1, col2 = st.columns(2)
@@ -102,45 +432,44 @@ if uploaded_file and api_key:
         st.markdown(f"<div style='border:1px solid #ccc; padding:1em; border-radius:10px;'>{default_content}</div>", unsafe_allow_html=True)
     with col2:
         st.markdown("**Oversættelse:**")
-        translated_content = df.at[selected_row, 'Translated content'] if pd.notna(df.at[selected_row, 'Translated content']) else ""
-
-        backup_key = f"backup_translated_{selected_row}"
-        if backup_key not in st.session_state:
-            st.session_state[backup_key] = translated_content
-        else:
-            translated_content = st.session_state[backup_key]
+        saved_content = df.at[selected_row, 'Translated content'] if pd.notna(df.at[selected_row, 'Translated content']) else ""
+        translated_content = saved_content
         translated_editor_active = st.checkbox("Vis HTML (oversat)", key=f"show_html_translated_{selected_row}")
 
         if translated_editor_active:
-            translated_content = st.text_area("HTML (oversat)", value=translated_content, height=200, key=f"html_trans_{selected_row}")
-            st.session_state[backup_key] = translated_content
+            translated_content = st.text_area("HTML (oversat)", value=saved_content, height=200, key=f"html_trans_{selected_row}")
+            if translated_content != saved_content:
+                st.caption("✏️ Ikke-gemt ændring – klik “Gem ændringer”.")
 
         st.markdown(f"<div style='border:1px solid #ccc; padding:1em; border-radius:10px;'>{translated_content}</div>", unsafe_allow_html=True)
 
     if st.button("💾 Gem ændringer"):
-        if translated_editor_active:
-            edited_text = translated_content
-        else:
-            edited_text = df.at[selected_row, 'Translated content']
-        original = "" if pd.isna(df.at[selected_row, "Translated content"]) else str(df.at[selected_row, "Translated content"])
+        edited_text = translated_content
         if edited_text.strip() == "":
             st.warning("Oversættelsen må ikke være tom – ændring blev ikke gemt.")
-        elif edited_text != original:
-            df.at[selected_row, "Translated content"] = edited_text
+        elif edited_text != saved_content:
+            set_translation(selected_row, edited_text)
             st.success("Ændring gemt!")
         else:
             st.info("Ingen ændringer at gemme.")
 
-    for idx in df.index:
-        backup_key = f"backup_translated_{idx}"
-        if backup_key in st.session_state:
-            df.at[idx, "Translated content"] = st.session_state[backup_key]
+    changed_rows = st.session_state["changed_rows"]
+    st.markdown(f"**{len(changed_rows)} ændrede rækker** i forhold til den uploadede fil.")
+    only_changed = st.checkbox(
+        "Eksportér kun ændrede/nyoversatte rækker (til Shopify-import)",
+        value=False,
+        disabled=not changed_rows
+    )
+
+    def export_csv():
+        frame = df.loc[sorted(changed_rows)] if only_changed else df
+        return frame.to_csv(index=False, encoding="utf-8-sig")
 
-    csv = df.to_csv(index=False, encoding="utf-8-sig")
+    # CSV'en bygges først når brugeren klikker download
     st.download_button(
         label="📂 Download oversat CSV",
-        data=csv,
-        file_name="shopify_translated.csv",
+        data=export_csv,
+        file_name="shopify_translated_changes.csv" if only_changed else "shopify_translated.csv",
         mime="text/csv"
     )
 else:
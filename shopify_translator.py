@@ -0,0 +1,267 @@
+"""Oversættelse af Shopify-CSV'er uden Streamlit: fælles motor for appen og kommandolinjen.
+
+Eksempel:
+    python shopify_translator.py export.csv oversat.csv --locales en,de --workers 16
+"""
+import argparse
+import os
+import sys
+import time
+
+import pandas as pd
+
+from csv_streaming import CHUNK_ROWS, read_locales, translate_csv_stream
+import llm_gateway
+from llm_metrics import traced_run
+from translation_engine import MODEL, SUPPORTED_LANGUAGES, TranslationEngine, clear_errors, translate_frame
+from translation_journal import TranslationJournal, file_hash, job_id
+from translation_memory import TranslationMemory
+from translation_planner import estimate_plan, estimate_seconds, merge_plans, rows_to_translate
+from translation_validation import report_frame, validate_and_repair
+
+DEFAULT_OPTIONS = {
+    "workers": 8,
+    "rpm": 500,
+    "tpm": 150000,
+    "use_memory": True,
+    "memory_path": None,
+    "batch_tokens": 2000,
+    "fanout": False,
+    "html_segments": False,
+    "validate": True,
+}
+
+
+def resolve_locales(codes):
+    """{locale: sprognavn} for de koder der er understøttet."""
+    return {code: SUPPORTED_LANGUAGES[code] for code in codes if code in SUPPORTED_LANGUAGES}
+
+
+def _resolve_options(options):
+    """Standardindstillingerne med `options` ovenpå; ukendte navne er en fejl frem for at blive ignoreret."""
+    unknown = set(options) - set(DEFAULT_OPTIONS)
+    if unknown:
+        raise TypeError(f"Ukendte indstillinger: {', '.join(sorted(unknown))}")
+    return {**DEFAULT_OPTIONS, **options}
+
+
+def _engine_options(options):
+    return {"workers": options["workers"], "rpm": options["rpm"], "tpm": options["tpm"]}
+
+
+def build_engine(api_key, workers=8, rpm=500, tpm=150000):
+    # Gatewayen er den eneste rate limiter; RPM/TPM er kontoens grænser og gælder for nøglen i alle
+    # sessioner og jobs. `workers` er kun denne kørsels trådpulje, ikke en grænse for nøglen.
+    llm_gateway.set_limits(api_key, rpm=rpm, tpm=tpm)
+    return TranslationEngine(api_key, workers=workers)
+
+
+def _frame_options(options):
+    memory = TranslationMemory(options.get("memory_path")) if options.get("use_memory", True) else None
+    return {
+        "memory": memory,
+        "batch_tokens": options.get("batch_tokens", 0),
+        "fanout": options.get("fanout", False),
+        "html_segments": options.get("html_segments", False),
+    }
+
+
+def _with_throughput(stats, engine, started):
+    elapsed = max(time.monotonic() - started, 1e-9)
+    stats.update({
+        "elapsed": elapsed,
+        "requests": engine.requests,
+        "tokens": engine.tokens,
+        "rows_per_second": stats.get("rows", 0) / elapsed,
+        "tokens_per_second": engine.tokens / elapsed,
+    })
+    return stats
+
+
+def translate_dataframe(df, api_key, locales, journal=None, on_progress=None, on_result=None, report=None,
+                        **options):
+    """Oversætter en indlæst DataFrame på stedet. Returnerer statistik inkl. throughput.
+
+    Med `validate` (standard) kontrolleres de nye oversættelser bagefter, og kun
+    fejlende rækker oversættes igen; rapporten pr. række føjes til listen `report`.
+    """
+    options = _resolve_options(options)
+    engine = build_engine(api_key, **_engine_options(options))
+    frame_options = _frame_options(options)
+
+    def record(index, translated_text):
+        if journal:
+            journal.record(index, translated_text)
+        if on_result:
+            on_result(index, translated_text)
+
+    started = time.monotonic()
+    rows = rows_to_translate(df, locales)
+    try:
+        stats = translate_frame(
+            df, engine, locales, rows=rows,
+            on_progress=on_progress, on_result=record,
+            **frame_options
+        )
+        if options["validate"]:
+            validation_stats, rows_report = validate_and_repair(
+                df, engine, locales, rows, memory=frame_options["memory"],
+                batch_tokens=frame_options["batch_tokens"], on_result=record
+            )
+            stats.update(validation_stats)
+            if report is not None:
+                report.extend(rows_report)
+        clear_errors(df, rows)
+    finally:
+        if journal:
+            journal.close()
+    return _with_throughput(stats, engine, started)
+
+
+def plan_dataframe(df, locales, reasons=None, **options):
+    """Plan og estimat for en indlæst DataFrame, uden at kalde modellen.
+
+    `reasons` er en allerede beregnet triage (se translation_planner.triage).
+    """
+    options = _resolve_options(options)
+    plan = estimate_plan(df, locales, reasons=reasons, **_frame_options(options))
+    plan["seconds"] = estimate_seconds(plan, **_engine_options(options))
+    return plan
+
+
+def plan_file(input_path, locales, chunk_rows=CHUNK_ROWS, **options):
+    """Som plan_dataframe, men læser filen bid for bid."""
+    options = _resolve_options(options)
+    frame_options = _frame_options(options)
+    plan = {}
+    for chunk in pd.read_csv(input_path, chunksize=chunk_rows):
+        chunk.columns = chunk.columns.str.strip()
+        plan = merge_plans(plan, estimate_plan(chunk, locales, **frame_options))
+    plan["seconds"] = estimate_seconds(plan, **_engine_options(options)) if plan else 0.0
+    return plan
+
+
+def format_plan(plan):
+    return (
+        f"{plan.get('rows_to_translate', 0)} af {plan.get('rows', 0)} rækker skal oversættes "
+        f"({plan.get('unique', 0)} unikke tekster, {plan.get('cached', 0)} allerede i hukommelsen) · "
+        f"ca. {plan.get('requests', 0)} forespørgsler · {plan.get('input_tokens', 0)} input- og "
+        f"{plan.get('output_tokens', 0)} output-tokens · ca. ${plan.get('cost', 0):.2f} · "
+        f"ca. {plan.get('seconds', 0) / 60:.1f} min"
+    )
+
+
+def file_job(input_path, locales, model=MODEL):
+    """Journalen for en inputfil med de valgte sprog."""
+    with open(input_path, "rb") as f:
+        return TranslationJournal(job_id(file_hash(f), locales, model))
+
+
+def translate_file(input_path, output_path, api_key, locales, resume=True, chunk_rows=CHUNK_ROWS,
+                   on_progress=None, report_path=None, **options):
+    """Oversætter en CSV fra fil til fil i bidder, med journal så jobbet kan genoptages.
+
+    Med `report_path` skrives kontrolrapporten (rækker der fejlede) som CSV.
+    """
+    options = _resolve_options(options)
+    engine = build_engine(api_key, **_engine_options(options))
+    journal = file_job(input_path, locales, engine.model)
+    if not resume:
+        journal.reset()
+    started = time.monotonic()
+    report = []
+    try:
+        stats = translate_csv_stream(
+            input_path, output_path, engine, locales,
+            chunk_rows=chunk_rows, on_progress=on_progress, journal=journal,
+            validate=options["validate"], report=report,
+            **_frame_options(options)
+        )
+    finally:
+        journal.close()
+    if report_path and options["validate"]:
+        report_frame(report).to_csv(report_path, index=False, encoding="utf-8-sig")
+    return _with_throughput(stats, engine, started)
+
+
+def format_stats(stats):
+    return (
+        f"{stats.get('rows', 0)} rækker ({stats.get('unique', 0)} unikke tekster) på {stats.get('elapsed', 0):.1f} s · "
+        f"{stats.get('rows_per_second', 0):.1f} rækker/s · {stats.get('tokens', 0)} tokens "
+        f"({stats.get('tokens_per_second', 0):.0f} tokens/s) · {stats.get('requests', 0)} forespørgsler · "
+        f"hukommelse {stats.get('hits', 0)} hits / {stats.get('misses', 0)} misses · {stats.get('errors', 0)} fejl"
+        + (f" · kontrol: {stats['invalid']} ugyldige, {stats.get('repaired', 0)} rettet" if "invalid" in stats else "")
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Oversæt en Shopify translation-CSV uden for Streamlit.")
+    parser.add_argument("input", help="Sti til CSV-eksport fra Shopify")
+    parser.add_argument("output", help="Sti til den oversatte CSV")
+    parser.add_argument("--locales", help="Kommaseparerede locales (standard: alle understøttede i filen)")
+    parser.add_argument("--api-key", default=os.environ.get("OPENAI_API_KEY"), help="OpenAI API-nøgle (standard: $OPENAI_API_KEY)")
+    parser.add_argument("--workers", type=int, default=DEFAULT_OPTIONS["workers"])
+    parser.add_argument("--rpm", type=int, default=DEFAULT_OPTIONS["rpm"], help="Maks. forespørgsler pr. minut")
+    parser.add_argument("--tpm", type=int, default=DEFAULT_OPTIONS["tpm"], help="Maks. tokens pr. minut")
+    parser.add_argument("--batch-tokens", type=int, default=DEFAULT_OPTIONS["batch_tokens"], help="Token-budget pr. batch (0 slår batching fra)")
+    parser.add_argument("--fanout", action="store_true", help="Oversæt til alle sprog i én forespørgsel pr. tekst")
+    parser.add_argument("--html-segments", action="store_true", help="Send kun tekstnoderne i HTML-felter til modellen")
+    parser.add_argument("--no-cache", action="store_true", help="Brug ikke oversættelseshukommelsen")
+    parser.add_argument("--cache-path", help="Sti til SQLite-filen med oversættelseshukommelse")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS, help="Rækker pr. bid")
+    parser.add_argument("--no-resume", action="store_true", help="Start forfra i stedet for at genoptage journalen")
+    parser.add_argument("--plan", action="store_true", help="Vis kun plan og estimat, uden at oversætte")
+    parser.add_argument("--no-validate", action="store_true", help="Spring kontrol og ny oversættelse af fejlende rækker over")
+    parser.add_argument("--report", help="Skriv kontrolrapporten (rækker der fejlede) til denne CSV")
+    args = parser.parse_args(argv)
+
+    if not args.api_key:
+        parser.error("Angiv --api-key eller sæt OPENAI_API_KEY")
+
+    codes = args.locales.split(",") if args.locales else read_locales(args.input)
+    locales = resolve_locales([c.strip() for c in codes])
+    if not locales:
+        parser.error("Ingen understøttede locales at oversætte")
+
+    options = {
+        "workers": args.workers,
+        "rpm": args.rpm,
+        "tpm": args.tpm,
+        "use_memory": not args.no_cache,
+        "memory_path": args.cache_path,
+        "batch_tokens": args.batch_tokens,
+        "fanout": args.fanout,
+        "html_segments": args.html_segments,
+        "validate": not args.no_validate,
+    }
+    if args.plan:
+        print(format_plan(plan_file(args.input, locales, chunk_rows=args.chunk_rows, **options)))
+        return 0
+
+    def progress(fraction):
+        print(f"\r{fraction * 100:5.1f} %", end="", file=sys.stderr, flush=True)
+
+    with traced_run("cli") as run:
+        stats = translate_file(
+            args.input, args.output, args.api_key, locales,
+            resume=not args.no_resume,
+            chunk_rows=args.chunk_rows,
+            on_progress=progress,
+            report_path=args.report,
+            **options
+        )
+    print(file=sys.stderr)
+    print(format_stats(stats))
+    for row in run.summary():
+        print(
+            f"  {row['stage']:<32} {row['calls']:>6} kald · p95 {row['latency_p95']:.2f} s · "
+            f"{row['prompt_tokens'] + row['completion_tokens']} tokens · {row['retries']} retries · ${row['cost_usd']:.4f}"
+        )
+    if "invalid" in stats:
+        # Fejlede rækker der blev rettet ved kontrollen, tæller ikke som fejl
+        return 1 if stats["invalid"] > stats["repaired"] else 0
+    return 1 if stats.get("errors") else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,178 @@
+"""Lokal SQLite-database til SEO-appens profiler, indstillinger og genererede tekster.
+
+Erstatter state.json: hver ændring skrives som én transaktion på den række
+den vedrører, så to sessioner ikke overskriver hinandens data, og
+artikeltekster hentes kun når de skal vises.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from storage import data_path
+
+STATE_DB = "seo_state.sqlite"
+LEGACY_STATE_FILE = "state.json"
+DEFAULT_PROFILE = "Standard profil"
+PROFILE_FIELDS = ("brand_profile", "blacklist", "produkt_info")
+
+
+def empty_profile():
+    return {field: "" for field in PROFILE_FIELDS}
+
+
+class StateStore:
+    def __init__(self, path=None):
+        self.path = path or data_path(STATE_DB)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(
+            "CREATE TABLE IF NOT EXISTS settings ("
+            " key TEXT PRIMARY KEY,"
+            " value TEXT);"
+            "CREATE TABLE IF NOT EXISTS profiles ("
+            " name TEXT PRIMARY KEY,"
+            " brand_profile TEXT DEFAULT '',"
+            " blacklist TEXT DEFAULT '',"
+            " produkt_info TEXT DEFAULT '',"
+            " updated REAL);"
+            "CREATE TABLE IF NOT EXISTS texts ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " profile TEXT,"
+            " created REAL,"
+            " words INTEGER,"
+            " body TEXT);"
+        )
+        self.conn.commit()
+
+    # -- indstillinger
+
+    def get_setting(self, key, default=None):
+        with self.lock:
+            row = self.conn.execute("SELECT value FROM settings WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def set_setting(self, key, value):
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)", (key, json.dumps(value))
+            )
+
+    # -- profiler
+
+    def profile_names(self):
+        with self.lock:
+            return [r[0] for r in self.conn.execute("SELECT name FROM profiles ORDER BY rowid")]
+
+    def get_profile(self, name):
+        """Profilens felter, eller tomme felter hvis profilen ikke findes."""
+        with self.lock:
+            row = self.conn.execute(
+                f"SELECT {', '.join(PROFILE_FIELDS)} FROM profiles WHERE name = ?", (name,)
+            ).fetchone()
+        if row is None:
+            return empty_profile()
+        return {field: value or "" for field, value in zip(PROFILE_FIELDS, row)}
+
+    def save_profile(self, name, **fields):
+        """Opretter profilen hvis den mangler og opdaterer kun de angivne felter."""
+        fields = {k: v for k, v in fields.items() if k in PROFILE_FIELDS}
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR IGNORE INTO profiles (name, updated) VALUES (?, ?)", (name, time.time())
+            )
+            if fields:
+                assignments = ", ".join(f"{k} = ?" for k in fields)
+                self.conn.execute(
+                    f"UPDATE profiles SET {assignments}, updated = ? WHERE name = ?",
+                    (*fields.values(), time.time(), name)
+                )
+
+    def rename_profile(self, old, new):
+        """Omdøber profilen (og dens tekster). Returnerer False hvis navnet er optaget."""
+        with self.lock, self.conn:
+            if self.conn.execute("SELECT 1 FROM profiles WHERE name = ?", (new,)).fetchone():
+                return False
+            self.conn.execute("INSERT OR IGNORE INTO profiles (name, updated) VALUES (?, ?)", (old, time.time()))
+            self.conn.execute("UPDATE profiles SET name = ?, updated = ? WHERE name = ?", (new, time.time(), old))
+            self.conn.execute("UPDATE texts SET profile = ? WHERE profile = ?", (new, old))
+        return True
+
+    def delete_profile(self, name):
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM profiles WHERE name = ?", (name,))
+
+    # -- genererede tekster
+
+    def add_text(self, body, profile=None):
+        with self.lock, self.conn:
+            cur = self.conn.execute(
+                "INSERT INTO texts (profile, created, words, body) VALUES (?, ?, ?, ?)",
+                (profile, time.time(), len(body.split()), body)
+            )
+        return cur.lastrowid
+
+    def count_texts(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM texts").fetchone()[0]
+
+    def list_texts(self, offset=0, limit=10):
+        """Én side af teksterne (nyeste først) uden selve brødteksten."""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT id, profile, created, words FROM texts ORDER BY id DESC LIMIT ? OFFSET ?",
+                (limit, offset)
+            ).fetchall()
+        return [dict(zip(("id", "profile", "created", "words"), r)) for r in rows]
+
+    def get_text(self, text_id):
+        with self.lock:
+            row = self.conn.execute("SELECT body FROM texts WHERE id = ?", (text_id,)).fetchone()
+        return row[0] if row else None
+
+    def delete_text(self, text_id):
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM texts WHERE id = ?", (text_id,))
+
+    # -- migrering
+
+    def migrate_json(self, path=None):
+        """Importerer en gammel state.json én gang og omdøber den til .migrated.
+
+        Returnerer True hvis der blev importeret noget.
+        """
+        path = path or data_path(LEGACY_STATE_FILE)
+        if not os.path.exists(path):
+            return False
+        try:
+            with open(path, "r") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return False
+        with self.lock, self.conn:
+            now = time.time()
+            for name, profile in (state.get("profiles") or {}).items():
+                profile = {**empty_profile(), **{k: str(v or "") for k, v in profile.items() if k in PROFILE_FIELDS}}
+                self.conn.execute(
+                    "INSERT OR IGNORE INTO profiles (name, brand_profile, blacklist, produkt_info, updated)"
+                    " VALUES (?, ?, ?, ?, ?)",
+                    (name, profile["brand_profile"], profile["blacklist"], profile["produkt_info"], now)
+                )
+            for body in state.get("generated_texts") or []:
+                self.conn.execute(
+                    "INSERT INTO texts (profile, created, words, body) VALUES (?, ?, ?, ?)",
+                    (None, now, len(str(body).split()), str(body))
+                )
+            for key in ("api_key", "page", "current_profile"):
+                if state.get(key):
+                    self.conn.execute(
+                        "INSERT OR IGNORE INTO settings (key, value) VALUES (?, ?)", (key, json.dumps(state[key]))
+                    )
+        os.replace(path, path + ".migrated")
+        return True
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
@@ -0,0 +1,36 @@
+"""Fælles placering af lokale datafiler (cache, databaser m.m.)."""
+import os
+
+# Samme valg som state-filen: brug /mnt/data hvis den findes og er skrivbar
+if os.path.exists("/mnt/data") and os.access("/mnt/data", os.W_OK):
+    DATA_DIR = "/mnt/data"
+else:
+    DATA_DIR = "."
+
+
+def data_path(name):
+    path = os.path.join(DATA_DIR, name)
+    folder = os.path.dirname(path)
+    if folder and not os.path.exists(folder):
+        os.makedirs(folder, exist_ok=True)
+    return path
+
+
+# SQLite har en grænse på antal parametre pr. forespørgsel
+SQLITE_CHUNK = 500
+
+
+def key_chunks(keys):
+    """Nøglerne i bidder som (bid, "?,?,…") til en `IN (…)`-betingelse."""
+    keys = list(keys)
+    for start in range(0, len(keys), SQLITE_CHUNK):
+        chunk = keys[start:start + SQLITE_CHUNK]
+        yield chunk, ",".join("?" * len(chunk))
+
+
+def get_many(conn, table, column, keys):
+    """{key: column} for de nøgler der findes i `table`."""
+    found = {}
+    for chunk, marks in key_chunks(keys):
+        found.update(conn.execute(f"SELECT key, {column} FROM {table} WHERE key IN ({marks})", chunk).fetchall())
+    return found
@@ -0,0 +1,419 @@
+"""Samtidig oversættelse af tekster via OpenAI gennem den fælles gateway (rate limit og backoff)."""
+import json
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import pandas as pd
+
+from html_segments import join_segments, looks_like_html, segment_texts, split_segments
+import llm_gateway
+from llm_metrics import run_in_context
+from rate_limit import estimate_tokens
+from translation_memory import make_key
+
+MODEL = "gpt-4-turbo"
+
+SUPPORTED_LANGUAGES = {
+    "en": "Engelsk", "de": "Tysk", "fr": "Fransk", "nl": "Hollandsk",
+    "es": "Spansk", "it": "Italiensk", "sv": "Svensk", "no": "Norsk",
+    "fi": "Finsk", "pl": "Polsk", "ja": "Japansk"
+}
+
+# Tekster under denne grænse (estimerede tokens) kan pakkes sammen i batches
+SHORT_TEXT_TOKENS = 200
+MAX_BATCH_ITEMS = 50
+# Fast overhead pr. element i JSON-objektet (nøgle, anførselstegn, komma)
+BATCH_ITEM_OVERHEAD = 8
+# Token-budget pr. kald, når tekstsegmenter fra én HTML-værdi oversættes
+HTML_BATCH_TOKENS = 3000
+# Markerer en fejlet række mens kørslen står på; ryddes inden output (se clear_errors)
+ERROR_PREFIX = "FEJL:"
+
+
+def build_system_prompt(language_name):
+    return (
+        f"Du er en professionel oversætter. Oversæt nøjagtigt og ordret fra dansk til {language_name}. "
+        "Bevar alle HTML-tags og strukturen præcis som den er. Du må ikke forklare noget. "
+        "Returnér KUN den oversatte tekst."
+    )
+
+
+def build_batch_prompt(language_name, fragments=False):
+    prompt = (
+        build_system_prompt(language_name) + " "
+        "Du får et JSON-objekt, hvor hver værdi er en tekst der skal oversættes. "
+        "Returnér et JSON-objekt med præcis de samme nøgler, hvor hver værdi er den oversatte tekst."
+    )
+    if fragments:
+        prompt += (
+            " Teksterne er tekststykker fra HTML-dokumenter i rækkefølge; stykker fra samme dokument står "
+            "efter hinanden, så oversæt dem i sammenhæng."
+        )
+    return prompt
+
+
+def build_fanout_prompt(language_names):
+    return (
+        "Du er en professionel oversætter. Oversæt nøjagtigt og ordret fra dansk til hvert af følgende sprog: "
+        + ", ".join(language_names) + ". "
+        "Bevar alle HTML-tags og strukturen præcis som den er. Du må ikke forklare noget. "
+        "Returnér KUN et JSON-objekt, hvor nøglerne er sprognavnene ovenfor og værdierne er de oversatte tekster."
+    )
+
+
+def pack_batches(items, token_budget, max_items=MAX_BATCH_ITEMS):
+    """Pakker [(key, tekst), ...] i batches, hvor hver batch holder sig under `token_budget`."""
+    batches = []
+    current = []
+    used = 0
+    for key, text in items:
+        cost = estimate_tokens(text) + BATCH_ITEM_OVERHEAD
+        if current and (used + cost > token_budget or len(current) >= max_items):
+            batches.append(current)
+            current = []
+            used = 0
+        current.append((key, text))
+        used += cost
+    if current:
+        batches.append(current)
+    return batches
+
+
+def parse_batch_response(content, ids):
+    """Returnerer {id: oversættelse} for de elementer i svaret der er gyldige."""
+    try:
+        data = json.loads(content)
+    except (TypeError, ValueError):
+        return {}
+    if not isinstance(data, dict):
+        return {}
+    valid = {}
+    for item_id in ids:
+        value = data.get(item_id)
+        if isinstance(value, str) and value.strip():
+            valid[item_id] = value.strip()
+    return valid
+
+
+class TranslationEngine:
+    """Oversætter mange tekster samtidigt med en fast pulje af workers.
+
+    Alle kald går gennem llm_gateway, som holder requests og tokens pr. minut
+    under nøglens grænser (se llm_gateway.set_limits) uanset antallet af workers.
+    """
+
+    def __init__(self, api_key, model=MODEL, workers=8, max_retries=6):
+        self.api_key = api_key
+        self.model = model
+        self.workers = max(1, int(workers))
+        self.max_retries = max_retries
+        self.requests = 0
+        self.tokens = 0
+        self._stats_lock = threading.Lock()
+
+    def complete(self, messages, stage="oversættelse", dedupe=True, **kwargs):
+        """Ét ChatCompletion-kald gennem gatewayen. Returnerer (tekst, tokens).
+
+        Med `dedupe=False` sendes kaldet altid, også selvom gatewayen har et
+        svar på samme forespørgsel (fx når en oversættelse er kasseret).
+        """
+        response = llm_gateway.complete(
+            stage,
+            dedupe=dedupe,
+            max_retries=self.max_retries,
+            model=self.model,
+            messages=messages,
+            api_key=self.api_key,
+            **kwargs
+        )
+        usage = response.get("usage") or {}
+        total = usage.get("total_tokens", 0)
+        with self._stats_lock:
+            self.requests += 1
+            self.tokens += total
+        return response.choices[0].message.content.strip(), total
+
+    def translate(self, text, language_name, dedupe=True):
+        translated, _ = self.complete([
+            {"role": "system", "content": build_system_prompt(language_name)},
+            {"role": "user", "content": f"{text}"}
+        ], dedupe=dedupe)
+        return translated
+
+    def translate_batch(self, items, language_name, fragments=False, dedupe=True):
+        """Oversætter flere korte tekster i ét kald. Returnerer {key: oversættelse}.
+
+        Elementer der mangler eller er ugyldige i svaret udelades, så kalderen
+        kan prøve dem igen enkeltvis.
+        """
+        ids = {str(i): key for i, (key, _) in enumerate(items)}
+        payload = {str(i): text for i, (_, text) in enumerate(items)}
+        content, _ = self.complete([
+            {"role": "system", "content": build_batch_prompt(language_name, fragments)},
+            {"role": "user", "content": json.dumps(payload, ensure_ascii=False)}
+        ], stage="oversættelse (HTML-segmenter)" if fragments else "oversættelse (batch)",
+            response_format={"type": "json_object"}, dedupe=dedupe)
+        valid = parse_batch_response(content, list(ids))
+        return {ids[item_id]: translated for item_id, translated in valid.items()}
+
+    def translate_fanout(self, text, items, dedupe=True):
+        """Oversætter én tekst til flere sprog i ét kald.
+
+        `items` = [(key, sprognavn), ...]. Returnerer {key: oversættelse}; sprog
+        der mangler i svaret udelades, så kun de prøves igen.
+        """
+        language_names = [language_name for _, language_name in items]
+        content, _ = self.complete([
+            {"role": "system", "content": build_fanout_prompt(language_names)},
+            {"role": "user", "content": f"{text}"}
+        ], stage="oversættelse (fan-out)", response_format={"type": "json_object"}, dedupe=dedupe)
+        valid = parse_batch_response(content, language_names)
+        return {key: valid[language_name] for key, language_name in items if language_name in valid}
+
+    def translate_html(self, html, language_name, dedupe=True):
+        """Oversætter kun tekstnoderne i `html` og sætter dem tilbage i den uændrede markup."""
+        parts, indices = split_segments(html)
+        items = list(enumerate(segment_texts(parts, indices)))
+        if not items:
+            return html
+        results = {}
+        for batch in pack_batches(items, HTML_BATCH_TOKENS, max_items=len(items)):
+            results.update(self.translate_batch(batch, language_name, fragments=True, dedupe=dedupe))
+        for i, segment in items:
+            if i not in results:
+                results[i] = self.translate(segment, language_name, dedupe=dedupe)
+        return join_segments(parts, indices, [results[i] for i, _ in items])
+
+    def translate_many(self, jobs, batch_tokens=0, fanout=False, html_segments=False, dedupe=True):
+        """Oversætter `jobs` = [(key, tekst, sprognavn), ...] samtidigt.
+
+        Yielder (key, oversættelse, fejl) efterhånden som kaldene bliver færdige,
+        så kalderen kan opdatere UI fra sin egen tråd. Med `batch_tokens` > 0
+        pakkes korte tekster pr. sprog i batches op til det token-budget;
+        lange tekster (fx body_html) sendes altid enkeltvis. Med `fanout` samles
+        alle sprog for samme kildetekst i ét kald, så input kun betales én gang.
+        Med `html_segments` sendes kun tekstnoderne i HTML-værdier; værdier uden
+        tekst springes helt over modellen, og med batching pakkes segmenter fra
+        flere værdier i samme batch. `dedupe=False` sendes videre til hvert kald.
+        """
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            futures = {}
+            # HTML-værdier hvis segmenter oversættes i fælles batches: key -> (dele, indeks, {nr: tekst})
+            documents = {}
+
+            def submit_single(key, text, language_name):
+                future = pool.submit(run_in_context(self.translate), text, language_name, dedupe)
+                futures[future] = ("single", [(key, text, language_name)])
+
+            def submit_segment(item, text, language_name):
+                future = pool.submit(run_in_context(self.translate), text, language_name, dedupe)
+                futures[future] = ("segment", [(item, text, language_name)])
+
+            def add_segment(item, translated):
+                """Gemmer et oversat segment og returnerer den samlede HTML, når værdien er komplet."""
+                key, n = item
+                if key not in documents:
+                    return None
+                parts, indices, done = documents[key]
+                done[n] = translated
+                if len(done) < len(indices):
+                    return None
+                del documents[key]
+                return join_segments(parts, indices, [done[i] for i in range(len(indices))])
+
+            segments_by_language = {}
+            if html_segments:
+                remaining = []
+                for key, text, language_name in jobs:
+                    if not looks_like_html(text):
+                        remaining.append((key, text, language_name))
+                        continue
+                    parts, indices = split_segments(text)
+                    if not indices:
+                        # Ingen tekst at oversætte (fx kun <img>): kopiér værdien uændret
+                        yield key, text, None
+                    elif batch_tokens:
+                        documents[key] = (parts, indices, {})
+                        segments_by_language.setdefault(language_name, []).extend(
+                            ((key, n), segment) for n, segment in enumerate(segment_texts(parts, indices))
+                        )
+                    else:
+                        future = pool.submit(run_in_context(self.translate_html), text, language_name, dedupe)
+                        futures[future] = ("single", [(key, text, language_name)])
+                jobs = remaining
+
+            if fanout:
+                by_text = {}
+                for key, text, language_name in jobs:
+                    by_text.setdefault(text, []).append((key, language_name))
+                jobs = []
+                for text, items in by_text.items():
+                    if len(items) == 1:
+                        jobs.append((items[0][0], text, items[0][1]))
+                        continue
+                    future = pool.submit(run_in_context(self.translate_fanout), text, items, dedupe)
+                    futures[future] = ("group", [(key, text, language_name) for key, language_name in items])
+
+            short_by_language = {}
+            for key, text, language_name in jobs:
+                if batch_tokens and estimate_tokens(text) <= SHORT_TEXT_TOKENS:
+                    short_by_language.setdefault(language_name, []).append((key, text))
+                else:
+                    submit_single(key, text, language_name)
+
+            for language_name, items in short_by_language.items():
+                for batch in pack_batches(items, batch_tokens):
+                    if len(batch) == 1:
+                        submit_single(batch[0][0], batch[0][1], language_name)
+                        continue
+                    future = pool.submit(run_in_context(self.translate_batch), batch, language_name, False, dedupe)
+                    futures[future] = ("group", [(key, text, language_name) for key, text in batch])
+
+            for language_name, items in segments_by_language.items():
+                for batch in pack_batches(items, max(batch_tokens, HTML_BATCH_TOKENS)):
+                    future = pool.submit(run_in_context(self.translate_batch), batch, language_name, True, dedupe)
+                    futures[future] = ("segments", [(item, text, language_name) for item, text in batch])
+
+            while futures:
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    kind, items = futures.pop(future)
+                    if kind == "single":
+                        key = items[0][0]
+                        try:
+                            yield key, future.result(), None
+                        except Exception as e:
+                            yield key, None, e
+                        continue
+                    if kind == "segment":
+                        item = items[0][0]
+                        try:
+                            html = add_segment(item, future.result())
+                        except Exception as e:
+                            # Ét segment fejlede: hele værdien fejler, og dens øvrige segmenter ignoreres
+                            if documents.pop(item[0], None) is not None:
+                                yield item[0], None, e
+                            continue
+                        if html is not None:
+                            yield item[0], html, None
+                        continue
+                    try:
+                        results = future.result()
+                    except Exception:
+                        # Hele kaldet fejlede – prøv elementerne enkeltvis
+                        results = {}
+                    for key, text, language_name in items:
+                        if kind == "group":
+                            if key in results:
+                                yield key, results[key], None
+                            else:
+                                submit_single(key, text, language_name)
+                        elif key in results:
+                            html = add_segment(key, results[key])
+                            if html is not None:
+                                yield key[0], html, None
+                        elif key[0] in documents:
+                            submit_segment(key, text, language_name)
+
+
+def is_untranslated(value):
+    """Tom værdi eller en FEJL-markering fra en tidligere kørsel."""
+    if pd.isna(value):
+        return True
+    value = str(value).strip()
+    return value == "" or value.startswith(ERROR_PREFIX)
+
+
+def needs_translation(row, locales):
+    """Rækken har et understøttet, valgt locale og mangler oversættelse."""
+    if row["Locale"] not in locales:
+        return False
+    return is_untranslated(row["Translated content"])
+
+
+def clear_errors(df, rows):
+    """Tømmer de rækker der stadig har en FEJL-markering, så den ikke ender i Shopify-importen.
+
+    Fejlen står i statistikken og kontrolrapporten; rækken oversættes igen ved næste kørsel.
+    """
+    rows = [index for index in rows if str(df.at[index, "Translated content"]).strip().startswith(ERROR_PREFIX)]
+    df.loc[rows, "Translated content"] = None
+    return len(rows)
+
+
+def group_pending(df, rows):
+    """Samler rækkerne i {(tekst, locale): [index, ...]}, så hver unik tekst kun oversættes én gang."""
+    pending = {}
+    rows = list(rows)
+    sources = df.loc[rows, "Default content"].tolist()
+    row_locales = df.loc[rows, "Locale"].tolist()
+    for index, source, locale in zip(rows, sources, row_locales):
+        pending.setdefault((source, locale), []).append(index)
+    return pending
+
+
+def translate_frame(df, engine, locales, memory=None, batch_tokens=0, fanout=False, html_segments=False,
+                    rows=None, on_progress=None, on_result=None, dedupe=True):
+    """Oversætter de rækker i `df` der mangler oversættelse og skriver resultatet tilbage.
+
+    `locales` = {locale: sprognavn} for de sprog der skal oversættes. `rows` er
+    de rækker planlæggeren har udvalgt; uden den gennemgås alle rækker. Identiske
+    (tekst, locale)-par oversættes kun én gang og slås op i `memory` først.
+    Returnerer en dict med statistik (hits, misses, dubletter, fejl).
+    """
+    if rows is None:
+        rows = [index for index, row in df.iterrows() if needs_translation(row, locales)]
+    pending = group_pending(df, rows)
+
+    def write_back(pair, translated_text):
+        for index in pending[pair]:
+            df.at[index, "Translated content"] = translated_text
+            if on_result:
+                on_result(index, translated_text)
+
+    total = len(pending)
+    keys = {}
+    cached = {}
+    if memory:
+        keys = {
+            (source, locale): make_key(source, locale, engine.model, build_system_prompt(locales[locale]))
+            for source, locale in pending
+        }
+        cached = memory.get_many(keys.values())
+        for pair, key in keys.items():
+            if key in cached:
+                write_back(pair, cached[key])
+    hits = sum(1 for key in keys.values() if key in cached)
+    jobs = [
+        (pair, pair[0], locales[pair[1]])
+        for pair in pending
+        if not memory or keys[pair] not in cached
+    ]
+
+    count = hits
+    errors = 0
+    if on_progress and total:
+        on_progress(count, total)
+    for pair, translated_text, error in engine.translate_many(
+        jobs, batch_tokens=batch_tokens, fanout=fanout, html_segments=html_segments, dedupe=dedupe
+    ):
+        if error is None:
+            write_back(pair, translated_text)
+            if memory:
+                memory.put(keys[pair], pair[0], pair[1], translated_text)
+        else:
+            errors += 1
+            for index in pending[pair]:
+                df.at[index, "Translated content"] = f"{ERROR_PREFIX} {error}"
+        count += 1
+        if on_progress:
+            on_progress(count, total)
+
+    return {
+        "rows": sum(len(rows) for rows in pending.values()),
+        "unique": total,
+        "hits": hits,
+        "misses": len(jobs),
+        "duplicates": sum(len(rows) for rows in pending.values()) - total,
+        "errors": errors,
+    }
@@ -0,0 +1,353 @@
+"""Lokal jobkø til oversættelse af Shopify-CSV'er i baggrunden.
+
+Jobs gemmes i SQLite sammen med inputfilen på disk og køres af en pulje af
+baggrundstråde med translate_file, så oversættelsen fortsætter selvom
+browserfanen lukkes. Fremdrift, ETA og resultat kan hentes senere, og et job
+kan annulleres mellem to bidder. Jobs der var i gang ved en genstart sættes
+tilbage i kø og genoptages fra journalen.
+
+API-nøglen gemmes ukrypteret i databasen, indtil jobbet er afsluttet, så
+jobs i kø kan køres efter en genstart eller af en separat workerproces.
+
+Workers kan også køres som en selvstændig proces:
+    python translation_jobs.py --workers 2
+"""
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+
+import llm_gateway
+from shopify_translator import resolve_locales, translate_file
+from storage import data_path
+
+JOBS_DB = "translation_jobs.sqlite"
+JOBS_DIR = "translation_jobs"
+JOB_WORKERS = 2
+# Mindre bidder end i CLI'en, så fremdrift og annullering reagerer hurtigere
+JOB_CHUNK_ROWS = 1000
+POLL_INTERVAL = 1.0
+
+QUEUED = "i kø"
+RUNNING = "kører"
+DONE = "færdig"
+FAILED = "fejl"
+CANCELLED = "annulleret"
+ACTIVE = (QUEUED, RUNNING)
+
+JOB_FIELDS = (
+    "id", "name", "status", "locales", "options", "progress", "created", "started",
+    "finished", "input_path", "output_path", "stats", "error", "cancel_requested", "worker_pid",
+    "report_path", "worker_token",
+)
+
+# Worker-puljer startet i denne proces; et kørende job med vores pid er kun
+# levende hvis dets token tilhører en pulje der stadig har tråde i gang
+_pools = set()
+_pools_lock = threading.Lock()
+
+
+class JobCancelled(Exception):
+    pass
+
+
+def _pid_alive(pid):
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        # Processen findes, men tilhører en anden bruger
+        return True
+    return True
+
+
+def _live_tokens():
+    with _pools_lock:
+        _pools.difference_update([p for p in _pools if not p.alive()])
+        return {p.token for p in _pools}
+
+
+def eta_seconds(job, now=None):
+    """Forventet resttid ud fra fremdriften indtil nu, eller None før der er noget at måle på."""
+    if job["status"] != RUNNING or not job["started"] or not job["progress"]:
+        return None
+    elapsed = (now or time.time()) - job["started"]
+    return elapsed * (1 - job["progress"]) / job["progress"]
+
+
+class JobQueue:
+    def __init__(self, path=None, folder=None):
+        self.path = path or data_path(JOBS_DB)
+        self.folder = folder or data_path(JOBS_DIR)
+        os.makedirs(self.folder, exist_ok=True)
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " name TEXT,"
+            " status TEXT,"
+            " locales TEXT,"
+            " options TEXT,"
+            " api_key TEXT,"
+            " progress REAL DEFAULT 0,"
+            " created REAL,"
+            " started REAL,"
+            " finished REAL,"
+            " input_path TEXT,"
+            " output_path TEXT,"
+            " stats TEXT,"
+            " error TEXT,"
+            " cancel_requested INTEGER DEFAULT 0,"
+            " worker_pid INTEGER,"
+            " report_path TEXT,"
+            " worker_token TEXT)"
+        )
+        # Databaser fra før kontrolrapporten og worker-token fik deres kolonner
+        columns = {r[1] for r in self.conn.execute("PRAGMA table_info(jobs)")}
+        for column in ("report_path", "worker_token"):
+            if column not in columns:
+                self.conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} TEXT")
+        self.conn.commit()
+
+    def _row(self, row):
+        job = dict(zip(JOB_FIELDS, row))
+        job["locales"] = json.loads(job["locales"] or "[]")
+        job["options"] = json.loads(job["options"] or "{}")
+        job["stats"] = json.loads(job["stats"]) if job["stats"] else None
+        return job
+
+    def submit(self, name, fileobj, locales, api_key, options=None):
+        """Lægger en upload i kø og returnerer job-id. `locales` er en liste af locale-koder."""
+        with self.lock, self.conn:
+            cur = self.conn.execute(
+                "INSERT INTO jobs (name, status, locales, options, api_key, created) VALUES (?, ?, ?, ?, ?, ?)",
+                (name, QUEUED, json.dumps(list(locales)), json.dumps(options or {}), api_key, time.time())
+            )
+            job_id = cur.lastrowid
+            folder = os.path.join(self.folder, str(job_id))
+            os.makedirs(folder, exist_ok=True)
+            input_path = os.path.join(folder, "input.csv")
+            fileobj.seek(0)
+            with open(input_path, "wb") as f:
+                shutil.copyfileobj(fileobj, f)
+            self.conn.execute(
+                "UPDATE jobs SET input_path = ?, output_path = ?, report_path = ? WHERE id = ?",
+                (input_path, os.path.join(folder, "output.csv"), os.path.join(folder, "report.csv"), job_id)
+            )
+        self.wakeup.set()
+        return job_id
+
+    def get(self, job_id):
+        with self.lock:
+            row = self.conn.execute(
+                f"SELECT {', '.join(JOB_FIELDS)} FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        return self._row(row) if row else None
+
+    def list_jobs(self, limit=50):
+        """De nyeste jobs først (uden API-nøgle)."""
+        with self.lock:
+            rows = self.conn.execute(
+                f"SELECT {', '.join(JOB_FIELDS)} FROM jobs ORDER BY id DESC LIMIT ?", (limit,)
+            ).fetchall()
+        return [self._row(r) for r in rows]
+
+    def claim_next(self, token=None):
+        """Tager det ældste job i kø og markerer det som kørende. Returnerer (job, api_key) eller None.
+
+        `token` identificerer worker-puljen, så requeue_interrupted kan se om jobbet stadig køres.
+        """
+        with self.lock, self.conn:
+            row = self.conn.execute(
+                "SELECT id, api_key FROM jobs WHERE status = ? ORDER BY id LIMIT 1", (QUEUED,)
+            ).fetchone()
+            if row is None:
+                return None
+            # Betingelsen på status gør, at to processer ikke kan tage samme job
+            cur = self.conn.execute(
+                "UPDATE jobs SET status = ?, started = ?, progress = 0, worker_pid = ?, worker_token = ?"
+                " WHERE id = ? AND status = ?",
+                (RUNNING, time.time(), os.getpid(), token, row[0], QUEUED)
+            )
+            if cur.rowcount != 1:
+                return None
+        return self.get(row[0]), row[1]
+
+    def set_progress(self, job_id, fraction):
+        """Gemmer fremdriften og returnerer True hvis jobbet er bedt om at stoppe."""
+        with self.lock, self.conn:
+            self.conn.execute("UPDATE jobs SET progress = ? WHERE id = ?", (fraction, job_id))
+            row = self.conn.execute("SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return bool(row and row[0])
+
+    def _finish(self, job_id, status, stats=None, error=None):
+        # API-nøglen gemmes kun så længe jobbet mangler at blive kørt
+        with self.lock, self.conn:
+            self.conn.execute(
+                "UPDATE jobs SET status = ?, finished = ?, stats = ?, error = ?, api_key = NULL,"
+                " progress = CASE WHEN ? THEN 1 ELSE progress END WHERE id = ?",
+                (status, time.time(), json.dumps(stats) if stats else None, error, status == DONE, job_id)
+            )
+
+    def complete(self, job_id, stats):
+        self._finish(job_id, DONE, stats=stats)
+
+    def fail(self, job_id, error):
+        self._finish(job_id, FAILED, error=str(error))
+
+    def cancel(self, job_id):
+        """Et job i kø annulleres straks; et kørende job stopper efter den aktuelle bid."""
+        with self.lock, self.conn:
+            self.conn.execute(
+                "UPDATE jobs SET status = ?, finished = ?, api_key = NULL WHERE id = ? AND status = ?",
+                (CANCELLED, time.time(), job_id, QUEUED)
+            )
+            self.conn.execute(
+                "UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND status = ?", (job_id, RUNNING)
+            )
+
+    def mark_cancelled(self, job_id):
+        self._finish(job_id, CANCELLED)
+
+    def delete(self, job_id):
+        """Sletter et afsluttet job og dets filer."""
+        with self.lock, self.conn:
+            cur = self.conn.execute(
+                f"DELETE FROM jobs WHERE id = ? AND status NOT IN ({', '.join('?' * len(ACTIVE))})",
+                (job_id, *ACTIVE)
+            )
+        if cur.rowcount:
+            shutil.rmtree(os.path.join(self.folder, str(job_id)), ignore_errors=True)
+        return bool(cur.rowcount)
+
+    def requeue_interrupted(self):
+        """Kørende jobs hvis proces er stoppet, sættes i kø igen (journalen genoptager dem).
+
+        Jobs der køres af en anden levende proces (fx `python translation_jobs.py`) røres ikke.
+        Et job med denne proces' eget pid er kun levende, hvis dets token tilhører en
+        pulje her der stadig kører: efter en genstart af en container får serveren
+        ofte samme pid som før, mens en ny pulje i samme proces (fx efter "Clear
+        cache" i Streamlit) ikke må tage jobs fra den gamle.
+        """
+        live = _live_tokens()
+        with self.lock, self.conn:
+            rows = self.conn.execute(
+                "SELECT id, worker_pid, worker_token FROM jobs WHERE status = ?", (RUNNING,)
+            ).fetchall()
+            stale = [
+                job_id for job_id, pid, token in rows
+                if (token not in live if pid == os.getpid() else not _pid_alive(pid))
+            ]
+            for job_id in stale:
+                self.conn.execute(
+                    "UPDATE jobs SET status = ?, cancel_requested = 0, worker_pid = NULL, worker_token = NULL"
+                    " WHERE id = ? AND status = ?",
+                    (QUEUED, job_id, RUNNING)
+                )
+        return len(stale)
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+def run_job(queue, job, api_key):
+    """Kører ét job med translate_file og registrerer resultatet i køen."""
+    def on_progress(fraction):
+        if queue.set_progress(job["id"], fraction):
+            raise JobCancelled()
+
+    locales = resolve_locales(job["locales"])
+    try:
+        if not locales:
+            raise ValueError("Ingen understøttede locales at oversætte")
+        # Hvert job er sin egen session i gatewayen, så samtidige jobs deler kaldene retfærdigt
+        with llm_gateway.use_session(f"job-{job['id']}"):
+            stats = translate_file(
+                job["input_path"], job["output_path"], api_key, locales,
+                resume=True, chunk_rows=JOB_CHUNK_ROWS, on_progress=on_progress,
+                report_path=job["report_path"], **job["options"]
+            )
+    except JobCancelled:
+        queue.mark_cancelled(job["id"])
+    except Exception as e:
+        queue.fail(job["id"], e)
+    else:
+        queue.complete(job["id"], stats)
+
+
+class JobWorkers:
+    """En pulje af daemon-tråde der henter jobs fra køen, indtil stop() kaldes."""
+
+    def __init__(self, queue, workers=JOB_WORKERS, poll_interval=POLL_INTERVAL):
+        self.queue = queue
+        self.poll_interval = poll_interval
+        self.token = uuid.uuid4().hex
+        self.stopping = threading.Event()
+        self.threads = [
+            threading.Thread(target=self._loop, name=f"translation-job-{n}", daemon=True)
+            for n in range(max(1, int(workers)))
+        ]
+
+    def start(self):
+        self.queue.requeue_interrupted()
+        with _pools_lock:
+            _pools.add(self)
+        for thread in self.threads:
+            thread.start()
+        return self
+
+    def alive(self):
+        """Puljen har stadig tråde i gang (også efter stop(), indtil det aktuelle job er færdigt)."""
+        return any(thread.is_alive() for thread in self.threads)
+
+    def _loop(self):
+        while not self.stopping.is_set():
+            claimed = self.queue.claim_next(self.token)
+            if claimed is None:
+                self.queue.wakeup.wait(self.poll_interval)
+                self.queue.wakeup.clear()
+                continue
+            run_job(self.queue, *claimed)
+
+    def stop(self, timeout=None):
+        """Stopper puljen efter de aktuelle jobs; med timeout=0 ventes der ikke på dem."""
+        self.stopping.set()
+        self.queue.wakeup.set()
+        for thread in self.threads:
+            thread.join(timeout)
+
+
+def stop_workers(queue, timeout=0):
+    """Stopper alle puljer i denne proces der henter jobs fra `queue`."""
+    with _pools_lock:
+        pools = [p for p in _pools if p.queue is queue]
+    for pool in pools:
+        pool.stop(timeout)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Kør oversættelsesjobs fra køen uden Streamlit.")
+    parser.add_argument("--workers", type=int, default=JOB_WORKERS, help="Jobs der køres samtidigt")
+    args = parser.parse_args(argv)
+    pool = JobWorkers(JobQueue(), workers=args.workers).start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pool.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,130 @@
+"""Append-only journal på disk, så en afbrudt oversættelse kan genoptages."""
+import hashlib
+import json
+import os
+import threading
+from array import array
+
+from storage import data_path
+
+JOURNAL_DIR = "journals"
+
+
+def file_hash(fileobj, block_size=1 << 20):
+    """SHA-256 af en fil eller upload, læst i blokke."""
+    h = hashlib.sha256()
+    fileobj.seek(0)
+    for block in iter(lambda: fileobj.read(block_size), b""):
+        h.update(block)
+    fileobj.seek(0)
+    return h.hexdigest()
+
+
+def job_id(upload_hash, locales, model):
+    """Jobbet identificeres af den uploadede fil og de indstillinger der påvirker resultatet."""
+    settings = json.dumps({"locales": sorted(locales), "model": model}, sort_keys=True)
+    return hashlib.sha256(f"{upload_hash}:{settings}".encode("utf-8")).hexdigest()[:32]
+
+
+class TranslationJournal:
+    """Én JSON-linje pr. færdig række: {"index": ..., "translation": ...}."""
+
+    def __init__(self, job, folder=None):
+        self.path = os.path.join(folder or data_path(JOURNAL_DIR), f"{job}.jsonl")
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.lock = threading.Lock()
+        self._file = None
+
+    def load(self):
+        """Returnerer {index: oversættelse} for alle færdige rækker."""
+        done = {}
+        if not os.path.exists(self.path):
+            return done
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # Sidste linje kan være halvt skrevet, hvis processen døde
+                    continue
+                done[entry["index"]] = entry["translation"]
+        return done
+
+    def index(self, chunk_rows):
+        """{bidnummer: filpositioner} for journalens linjer, så en bid kan læses for sig.
+
+        Kun positionerne holdes i hukommelsen, ikke oversættelserne.
+        """
+        offsets = {}
+        if not os.path.exists(self.path):
+            return offsets
+        with open(self.path, "rb") as f:
+            position = 0
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    entry = None
+                if entry:
+                    offsets.setdefault(entry["index"] // chunk_rows, array("q")).append(position)
+                position += len(line)
+        return offsets
+
+    def load_at(self, offsets):
+        """Som load, men kun for linjerne på `offsets` (fra index)."""
+        done = {}
+        with open(self.path, "rb") as f:
+            for offset in offsets:
+                f.seek(offset)
+                entry = json.loads(f.readline())
+                done[entry["index"]] = entry["translation"]
+        return done
+
+    def count(self):
+        """Antal færdige rækker, uden at holde oversættelserne i hukommelsen."""
+        rows = set()
+        if os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        rows.add(json.loads(line)["index"])
+                    except ValueError:
+                        continue
+        return len(rows)
+
+    def apply(self, df, done=None):
+        """Skriver journalens rækker ind i `df` og returnerer antallet."""
+        done = self.load() if done is None else done
+        applied = 0
+        for index, translation in done.items():
+            if index in df.index:
+                df.at[index, "Translated content"] = translation
+                applied += 1
+        return applied
+
+    def record(self, index, translation):
+        with self.lock:
+            if self._file is None:
+                self._file = open(self.path, "a", encoding="utf-8")
+                if self._file.tell() and not self._ends_with_newline():
+                    # En halvt skrevet sidste linje (fx efter et nedbrud) afsluttes, så den
+                    # første nye række ikke havner på samme linje og går tabt
+                    self._file.write("\n")
+            self._file.write(json.dumps({"index": int(index), "translation": translation}, ensure_ascii=False) + "\n")
+            self._file.flush()
+
+    def _ends_with_newline(self):
+        with open(self.path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b"\n"
+
+    def reset(self):
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def close(self):
+        with self.lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
@@ -0,0 +1,62 @@
+"""Lokal oversættelseshukommelse (SQLite), så identiske tekster kun oversættes én gang."""
+import hashlib
+import sqlite3
+import threading
+import time
+
+from storage import data_path, get_many, key_chunks
+
+TM_FILE = "translation_memory.sqlite"
+
+
+def make_key(source, locale, model, system_prompt):
+    """Hash af kildetekst + locale + model + systemprompt."""
+    h = hashlib.sha256()
+    for part in (source, locale, model, system_prompt):
+        h.update(str(part).encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+class TranslationMemory:
+    def __init__(self, path=None):
+        self.path = path or data_path(TM_FILE)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS translations ("
+            " key TEXT PRIMARY KEY,"
+            " locale TEXT,"
+            " source TEXT,"
+            " translation TEXT,"
+            " created REAL)"
+        )
+        self.conn.commit()
+
+    def get_many(self, keys):
+        """Returnerer {key: oversættelse} for de nøgler der findes."""
+        with self.lock:
+            return get_many(self.conn, "translations", "translation", keys)
+
+    def get(self, key):
+        return self.get_many([key]).get(key)
+
+    def put(self, key, source, locale, translation):
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO translations (key, locale, source, translation, created) VALUES (?, ?, ?, ?, ?)",
+                (key, locale, source, translation, time.time())
+            )
+            self.conn.commit()
+
+    def forget(self, keys):
+        """Fjerner oversættelser (fx dem der fejlede kontrollen), så de oversættes igen."""
+        with self.lock:
+            for chunk, marks in key_chunks(keys):
+                self.conn.execute(f"DELETE FROM translations WHERE key IN ({marks})", chunk)
+            self.conn.commit()
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
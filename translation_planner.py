@@ -0,0 +1,190 @@
+"""Planlægning før oversættelse: triage af rækker og offline estimat af tokens, tid og pris."""
+import math
+import re
+
+import numpy as np
+import pandas as pd
+
+from html_segments import looks_like_html, segment_texts, split_segments
+from llm_metrics import estimate_cost
+from rate_limit import estimate_tokens
+from translation_engine import (
+    ERROR_PREFIX, HTML_BATCH_TOKENS, MODEL, SHORT_TEXT_TOKENS, SUPPORTED_LANGUAGES, build_batch_prompt,
+    build_fanout_prompt, build_system_prompt, group_pending, pack_batches
+)
+from translation_memory import make_key
+
+TRANSLATE = "translate"
+
+# Rækkefølgen er prioriteten: den første årsag der passer, bruges
+REASON_LABELS = {
+    "unsupported": "Sprog ikke understøttet",
+    "not_selected": "Sprog ikke valgt",
+    "translated": "Allerede oversat",
+    "empty": "Tom værdi",
+    "number": "Kun tal",
+    "url": "URL",
+    "handle": "Handle",
+    TRANSLATE: "Skal oversættes",
+}
+
+NUMBER_RE = r"^[\d\s.,:;%+\-–/()]+$"
+URL_RE = r"^(?:https?://|www\.|/|mailto:|tel:)\S*$"
+
+# Forudsætninger for tidsestimatet
+OUTPUT_RATIO = 1.2
+BASE_LATENCY = 1.0
+OUTPUT_TOKENS_PER_SECOND = 40.0
+
+
+def triage(df, locales):
+    """Returnerer en Series med årsagskode pr. række (se REASON_LABELS)."""
+    locale = df["Locale"]
+    text = df["Default content"].fillna("").astype(str).str.strip()
+    translated = df["Translated content"].fillna("").astype(str).str.strip()
+    field = df["Field"].fillna("").astype(str) if "Field" in df else pd.Series("", index=df.index)
+    conditions = [
+        ~locale.isin(list(SUPPORTED_LANGUAGES)),
+        ~locale.isin(list(locales)),
+        (translated != "") & ~translated.str.startswith(ERROR_PREFIX),
+        text == "",
+        text.str.match(NUMBER_RE),
+        text.str.match(URL_RE, flags=re.IGNORECASE),
+        field.str.endswith("handle"),
+    ]
+    choices = list(REASON_LABELS)[:len(conditions)]
+    return pd.Series(np.select(conditions, choices, default=TRANSLATE), index=df.index)
+
+
+def rows_to_translate(df, locales, reasons=None):
+    reasons = triage(df, locales) if reasons is None else reasons
+    return df.index[reasons == TRANSLATE]
+
+
+def _request_tokens(prompt, texts, output_texts=None):
+    output_texts = texts if output_texts is None else output_texts
+    tokens_in = estimate_tokens(prompt) + sum(estimate_tokens(t) for t in texts)
+    tokens_out = math.ceil(sum(estimate_tokens(t) for t in output_texts) * OUTPUT_RATIO)
+    return tokens_in, tokens_out
+
+
+def estimate_plan(df, locales, memory=None, model=MODEL, batch_tokens=0, fanout=False,
+                  html_segments=False, reasons=None):
+    """Offline estimat af forespørgsler og tokens for de rækker der skal oversættes.
+
+    Simulerer samme opdeling som TranslationEngine.translate_many (dubletter,
+    hukommelse, HTML-segmenter, fan-out og batches), men uden at kalde modellen.
+    """
+    reasons = triage(df, locales) if reasons is None else reasons
+    rows = rows_to_translate(df, locales, reasons)
+    pending = group_pending(df, rows)
+
+    cached = 0
+    if memory and pending:
+        keys = {
+            (source, locale): make_key(source, locale, model, build_system_prompt(locales[locale]))
+            for source, locale in pending
+        }
+        hits = memory.get_many(keys.values())
+        cached = sum(1 for key in keys.values() if key in hits)
+        pending = {pair: indices for pair, indices in pending.items() if keys[pair] not in hits}
+
+    requests = 0
+    tokens_in = 0
+    tokens_out = 0
+
+    def add(count, t_in, t_out):
+        nonlocal requests, tokens_in, tokens_out
+        requests += count
+        tokens_in += t_in
+        tokens_out += t_out
+
+    jobs = []
+    segments_by_locale = {}
+    for source, locale in pending:
+        text = str(source)
+        if html_segments and looks_like_html(text):
+            parts, indices = split_segments(text)
+            segments = segment_texts(parts, indices)
+            if batch_tokens:
+                # Segmenter fra flere værdier deler batches (som i translate_many)
+                segments_by_locale.setdefault(locale, []).extend((None, t) for t in segments)
+                continue
+            prompt = build_batch_prompt(locales[locale], fragments=True)
+            for batch in pack_batches(list(enumerate(segments)), HTML_BATCH_TOKENS, max_items=len(segments) or 1):
+                add(1, *_request_tokens(prompt, [t for _, t in batch]))
+        else:
+            jobs.append((text, locale))
+    for locale, items in segments_by_locale.items():
+        prompt = build_batch_prompt(locales[locale], fragments=True)
+        for batch in pack_batches(items, max(batch_tokens, HTML_BATCH_TOKENS)):
+            add(1, *_request_tokens(prompt, [t for _, t in batch]))
+
+    if fanout:
+        by_text = {}
+        for text, locale in jobs:
+            by_text.setdefault(text, []).append(locale)
+        jobs = []
+        for text, text_locales in by_text.items():
+            if len(text_locales) == 1:
+                jobs.append((text, text_locales[0]))
+                continue
+            prompt = build_fanout_prompt([locales[loc] for loc in text_locales])
+            add(1, *_request_tokens(prompt, [text], [text] * len(text_locales)))
+
+    short_by_locale = {}
+    for text, locale in jobs:
+        if batch_tokens and estimate_tokens(text) <= SHORT_TEXT_TOKENS:
+            short_by_locale.setdefault(locale, []).append((None, text))
+        else:
+            add(1, *_request_tokens(build_system_prompt(locales[locale]), [text]))
+    for locale, items in short_by_locale.items():
+        for batch in pack_batches(items, batch_tokens):
+            prompt = build_system_prompt(locales[locale]) if len(batch) == 1 else build_batch_prompt(locales[locale])
+            add(1, *_request_tokens(prompt, [t for _, t in batch]))
+
+    return {
+        "rows": len(df),
+        "reasons": reasons.value_counts().to_dict(),
+        "rows_to_translate": len(rows),
+        "unique": len(pending) + cached,
+        "cached": cached,
+        "requests": requests,
+        "input_tokens": tokens_in,
+        "output_tokens": tokens_out,
+        "cost": estimate_cost(model, tokens_in, tokens_out),
+    }
+
+
+def merge_plans(a, b):
+    """Lægger to planer sammen (bruges når filen planlægges bid for bid)."""
+    merged = dict(a)
+    for k, v in b.items():
+        if k == "reasons":
+            reasons = dict(a.get("reasons", {}))
+            for reason, count in v.items():
+                reasons[reason] = reasons.get(reason, 0) + count
+            merged["reasons"] = reasons
+        else:
+            merged[k] = a.get(k, 0) + v
+    return merged
+
+
+def estimate_seconds(plan, workers=8, rpm=500, tpm=150000):
+    """Forventet varighed ved den valgte samtidighed og rate limits."""
+    requests = plan["requests"]
+    if not requests:
+        return 0.0
+    latency = BASE_LATENCY + plan["output_tokens"] / requests / OUTPUT_TOKENS_PER_SECOND
+    total_tokens = plan["input_tokens"] + plan["output_tokens"]
+    return max(
+        requests * latency / max(1, workers),
+        requests / rpm * 60,
+        total_tokens / tpm * 60,
+    )
+
+
+def triage_table(df, reasons):
+    """Antal rækker pr. Type/Field og årsag, til visning i UI."""
+    table = df.assign(Årsag=reasons.map(REASON_LABELS))
+    return table.groupby(["Type", "Field", "Årsag"]).size().unstack(fill_value=0)
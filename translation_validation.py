@@ -0,0 +1,151 @@
+"""Strukturel kontrol af oversættelser mod kildeteksten.
+
+Hver oversat række sammenlignes med sin kilde: samme HTML-tags i samme
+rækkefølge, samme {{ }}-placeholders og Liquid-tags, ingen tomme svar eller
+FEJL-rækker og en rimelig længde. Kun de rækker der fejler, oversættes igen –
+med HTML-segmenter, så markup og Liquid bevares uændret – og resultatet samles
+i en rapport pr. række.
+"""
+import re
+from collections import Counter
+
+import pandas as pd
+
+from html_segments import LIQUID_RE, TAG_RE
+from translation_engine import ERROR_PREFIX, build_system_prompt, translate_frame
+from translation_memory import make_key
+
+VALIDATION_RETRIES = 1
+# Længdekontrollen bruges kun på kilder med mindst så mange tegn synlig tekst
+MIN_RATIO_CHARS = 20
+MIN_LENGTH_RATIO = 0.3
+MAX_LENGTH_RATIO = 3.0
+
+ISSUE_LABELS = {
+    "error": "Oversættelsen fejlede",
+    "empty": "Tom oversættelse",
+    "tags": "HTML-tags mangler eller er flyttet",
+    "placeholders": "{{ }}-placeholders mangler eller er ændret",
+    "liquid": "Liquid-tags ({% %}) mangler eller er flyttet",
+    "length": "Usædvanlig længde ift. kilden",
+}
+
+TAG_NAME_RE = re.compile(r"<\s*(/?)\s*([a-zA-Z][\w:-]*)")
+
+
+def _text(value):
+    return "" if value is None or pd.isna(value) else str(value)
+
+
+def _tags(text):
+    """Tagnavne (og om de lukker) i rækkefølge; kommentarer og doctype tæller ikke."""
+    tags = []
+    for match in TAG_RE.finditer(text):
+        name = TAG_NAME_RE.match(match.group(0))
+        if name:
+            tags.append((name.group(1), name.group(2).lower()))
+    return tags
+
+
+def _liquid(text, opener):
+    """Liquid-udtryk med `opener` uden mellemrum, så {{shop}} og {{ shop }} regnes for ens."""
+    return ["".join(m.split()) for m in LIQUID_RE.findall(text) if m.startswith(opener)]
+
+
+def _visible_length(text):
+    return len(" ".join(TAG_RE.sub(" ", LIQUID_RE.sub(" ", text)).split()))
+
+
+def check_translation(source, translation):
+    """Listen af problemkoder (se ISSUE_LABELS) for én oversættelse; tom liste hvis den er i orden."""
+    source, translation = _text(source), _text(translation)
+    if translation.strip().startswith(ERROR_PREFIX):
+        return ["error"]
+    if not translation.strip():
+        return ["empty"] if source.strip() else []
+    issues = []
+    if _tags(source) != _tags(translation):
+        issues.append("tags")
+    # Variabler må gerne flytte sig i sætningen, men kontrolstrukturen skal stå i samme rækkefølge
+    if Counter(_liquid(source, "{{")) != Counter(_liquid(translation, "{{")):
+        issues.append("placeholders")
+    if _liquid(source, "{%") != _liquid(translation, "{%"):
+        issues.append("liquid")
+    source_length = _visible_length(source)
+    if source_length >= MIN_RATIO_CHARS:
+        ratio = _visible_length(translation) / source_length
+        if not MIN_LENGTH_RATIO <= ratio <= MAX_LENGTH_RATIO:
+            issues.append("length")
+    return issues
+
+
+def validate_frame(df, locales, rows=None):
+    """{index: [problemkoder]} for de oversatte rækker der fejler kontrollen.
+
+    Uden `rows` kontrolleres alle rækker med et af de valgte sprog.
+    """
+    if rows is None:
+        rows = df.index[df["Locale"].isin(list(locales))]
+    rows = list(rows)
+    issues = {}
+    sources = df.loc[rows, "Default content"].tolist()
+    translations = df.loc[rows, "Translated content"].tolist()
+    for index, source, translation in zip(rows, sources, translations):
+        found = check_translation(source, translation)
+        if found:
+            issues[index] = found
+    return issues
+
+
+def retranslate_rows(df, engine, locales, rows, memory=None, batch_tokens=0, on_result=None):
+    """Oversætter `rows` forfra med HTML-segmenter.
+
+    De fejlede oversættelser fjernes også fra hukommelsen, og kaldene sendes
+    uden om gatewayens cache, så det samme dårlige svar ikke bare slås op igen.
+    """
+    rows = list(rows)
+    if memory:
+        memory.forget({
+            make_key(source, locale, engine.model, build_system_prompt(locales[locale]))
+            for source, locale in zip(df.loc[rows, "Default content"], df.loc[rows, "Locale"])
+            if locale in locales
+        })
+    df.loc[rows, "Translated content"] = None
+    return translate_frame(
+        df, engine, locales, memory=memory, batch_tokens=batch_tokens, html_segments=True,
+        rows=rows, on_result=on_result, dedupe=False
+    )
+
+
+def validate_and_repair(df, engine, locales, rows, memory=None, batch_tokens=0,
+                        retries=VALIDATION_RETRIES, on_result=None):
+    """Kontrollerer `rows` og oversætter kun de fejlende rækker igen, højst `retries` gange.
+
+    Returnerer (statistik, rapport) hvor rapporten har én post pr. række der
+    fejlede første gang, med problemerne og om den blev rettet.
+    """
+    issues = validate_frame(df, locales, rows)
+    first = dict(issues)
+    for _ in range(retries):
+        if not issues:
+            break
+        retranslate_rows(df, engine, locales, issues, memory, batch_tokens, on_result)
+        issues = validate_frame(df, locales, list(issues))
+
+    report = []
+    for index, found in first.items():
+        report.append({
+            "index": int(index),
+            "Type": _text(df.at[index, "Type"]) if "Type" in df else "",
+            "Field": _text(df.at[index, "Field"]) if "Field" in df else "",
+            "Locale": _text(df.at[index, "Locale"]),
+            "Problemer": "; ".join(ISSUE_LABELS[code] for code in found),
+            "Efter ny oversættelse": "; ".join(ISSUE_LABELS[code] for code in issues.get(index, [])) or "OK",
+        })
+    stats = {"invalid": len(first), "repaired": len(first) - len(issues)}
+    return stats, report
+
+
+def report_frame(report):
+    columns = ["index", "Type", "Field", "Locale", "Problemer", "Efter ny oversættelse"]
+    return pd.DataFrame(report, columns=columns)